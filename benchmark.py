@@ -0,0 +1,205 @@
+"""Offline benchmark for the bridge server.
+
+Starts the bridge from web_fetch_server_node.py, runs simulated browser workers that speak
+the /job and /result protocol, drives WebFetchServerNode.process from several threads and
+reports throughput, latency percentiles and peak memory. No browser or network needed.
+
+    python benchmark.py --workers 4 --jobs 200 --concurrency 8 --mode image
+"""
+import argparse
+import http.client
+import importlib
+import importlib.util
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_bridge(state_dir):
+    # The node modules use relative imports, so register this folder as a package first
+    # (without running __init__, which would import the server right away).
+    # Job journal, site profiles and result cache are moved to state_dir before
+    # web_fetch_server_node is imported: that import replays the journal and starts the
+    # bridge thread, and benchmark jobs must never mix with those of a real ComfyUI.
+    spec = importlib.util.spec_from_file_location("webbridge", os.path.join(PACKAGE_DIR, "__init__.py"),
+                                                  submodule_search_locations=[PACKAGE_DIR])
+    sys.modules["webbridge"] = importlib.util.module_from_spec(spec)
+
+    journal = importlib.import_module("webbridge.web_fetch_journal")
+    if journal.JOURNAL.conn is not None:
+        journal.JOURNAL.conn.close() # Opened at import, never read or written
+    journal.JOURNAL_PATH = os.path.join(state_dir, "job_journal.sqlite3")
+    journal.JOURNAL = journal.JobJournal(journal.JOURNAL_PATH)
+
+    profiles = importlib.import_module("webbridge.web_fetch_profiles")
+    profiles.PROFILES_PATH = os.path.join(state_dir, "site_profiles.json")
+    profiles.PROFILES.clear()
+
+    cache = importlib.import_module("webbridge.web_fetch_cache")
+    cache.RESULT_CACHE_DIR = os.path.join(state_dir, "result_cache")
+
+    return importlib.import_module("webbridge.web_fetch_server_node")
+
+def make_png(width, height):
+    import numpy as np
+    from PIL import Image
+    pixels = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+    buff = BytesIO()
+    Image.fromarray(pixels).save(buff, format="PNG", compress_level=1)
+    return buff.getvalue()
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+# --- SIMULATED WORKER ---
+
+class SimulatedWorker(threading.Thread):
+    # Behaves like one browser tab running the userscript
+    def __init__(self, index, args, png_bytes, stop):
+        super().__init__(daemon=True)
+        self.worker_id = f"bench-{index}"
+        self.origin = f"https://bench-{index}.local"
+        self.args = args
+        self.png_bytes = png_bytes
+        self.stop = stop
+        self.completed = 0
+        self.failed = 0
+
+    def request(self, conn, method, path, body=None, headers=None):
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+
+    def run(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.args.port, timeout=30)
+        self.request(conn, "POST", "/workers", json.dumps({"id": self.worker_id, "origin": self.origin, "modes": ["image", "text"]}),
+                     {"Content-Type": "application/json"})
+
+        while not self.stop.is_set():
+            status, body = self.request(conn, "GET", f"/job?worker={self.worker_id}&wait=1")
+            job = json.loads(body).get("job") if status == 200 else None
+            if not job:
+                continue
+
+            started = time.time()
+            if job.get("input_blob"):
+                self.request(conn, "GET", f"/blob/{job['input_blob']}")
+            think = max(0.0, random.gauss(self.args.think, self.args.think * self.args.jitter))
+            time.sleep(think)
+
+            headers = {"X-WebBridge-Timings": json.dumps({"input": round((time.time() - started - think) * 1000), "result": round(think * 1000)})}
+            if random.random() < self.args.failure_rate:
+                headers["Content-Type"] = "application/json"
+                self.request(conn, "POST", f"/result/{job['id']}", json.dumps({"error": "Simulated failure"}), headers)
+                self.failed += 1
+            elif job.get("mode") == "text":
+                headers["Content-Type"] = "application/json"
+                self.request(conn, "POST", f"/result/{job['id']}", json.dumps({"text": "x" * self.args.text_chars}), headers)
+                self.completed += 1
+            else:
+                headers["Content-Type"] = "image/png"
+                self.request(conn, "POST", f"/result/{job['id']}", self.png_bytes, headers)
+                self.completed += 1
+        conn.close()
+
+# --- DRIVER ---
+
+def run_job(node, args, index, input_image):
+    mode = args.mode if args.mode != "mixed" else random.choice(["image", "text"])
+    started = time.time()
+    try:
+        node.process(mode.capitalize(), f"benchmark prompt {index}", input_image=input_image, timeout=args.timeout, seed=index)
+        return time.time() - started, None
+    except Exception as e:
+        return time.time() - started, str(e)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the WebBridge server.")
+    parser.add_argument("--workers", type=int, default=4, help="Simulated browser tabs")
+    parser.add_argument("--jobs", type=int, default=100, help="Total node executions")
+    parser.add_argument("--concurrency", type=int, default=4, help="Node executions running at the same time")
+    parser.add_argument("--mode", choices=["image", "text", "mixed"], default="image")
+    parser.add_argument("--image-size", default="512x512", help="Result image size WxH")
+    parser.add_argument("--input-image", action="store_true", help="Send an input image of --image-size with every job")
+    parser.add_argument("--text-chars", type=int, default=2000, help="Length of text results")
+    parser.add_argument("--think", type=float, default=0.05, help="Mean simulated generation time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Standard deviation of the think time, relative to --think")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of jobs the workers report as failed")
+    parser.add_argument("--timeout", type=int, default=60, help="Node timeout per execution in seconds")
+    args = parser.parse_args()
+
+    state_dir = tempfile.mkdtemp(prefix="webbridge-benchmark-")
+    try:
+        run(args, load_bridge(state_dir))
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+def run(args, server):
+    args.port = server.PORT
+    # The server thread ends right away when it cannot bind. Carrying on would run the
+    # simulated workers against whatever holds the port, e.g. a live ComfyUI bridge.
+    server.server_thread.join(timeout=0.5)
+    if not server.server_thread.is_alive():
+        sys.exit(f"Port {server.PORT} is in use (ComfyUI running?). Stop it before benchmarking.")
+
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    png_bytes = make_png(width, height) if args.mode != "text" else b""
+    input_image = None
+    if args.input_image:
+        import torch
+        input_image = torch.rand((1, height, width, 3))
+
+    stop = threading.Event()
+    workers = [SimulatedWorker(i, args, png_bytes, stop) for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    node = server.WebFetchServerNode()
+    print(f"[WebBridge] Benchmark: {args.jobs} jobs, {args.workers} workers, concurrency {args.concurrency}, mode {args.mode}, image {width}x{height}")
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda i: run_job(node, args, i, input_image), range(args.jobs)))
+    elapsed = time.time() - started
+
+    stop.set()
+    for worker in workers:
+        worker.join(timeout=5)
+
+    latencies = [latency for latency, error in results if error is None]
+    errors = [error for latency, error in results if error is not None]
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Linux reports KiB
+
+    print("")
+    print(f"Jobs:        {len(results)} ({len(errors)} failed)")
+    print(f"Elapsed:     {elapsed:.2f} s")
+    print(f"Throughput:  {len(results) / elapsed:.1f} jobs/s")
+    print(f"Latency:     p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, max {max(latencies, default=0) * 1000:.1f} ms")
+    print(f"Peak RSS:    {peak_rss_mb:.1f} MB")
+    in_flight = server.spool.stats()
+    print(f"Results:     peak {in_flight['peak'] / 1024 / 1024:.1f} MB in flight, {in_flight['rejected']} uploads deferred")
+    if errors:
+        print(f"First error: {errors[0]}")
+
+    print("")
+    print("Bridge phases (p50 / p95 / p99 ms):")
+    for site, modes in server.metrics.stats().items():
+        for mode, phases in modes.items():
+            for phase, entry in phases.items():
+                print(f"  {site:<20} {mode:<6} {phase:<8} {entry['p50'] * 1000:8.1f} {entry['p95'] * 1000:8.1f} {entry['p99'] * 1000:8.1f}")
+
+if __name__ == "__main__":
+    main()
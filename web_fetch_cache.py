@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import torch
+from collections import OrderedDict
+
+class ByteLRU:
+    # Thread-safe LRU mapping bounded by total size in bytes instead of entry count
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (value, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size, keep=()):
+        # keep: keys that must not be evicted right now (e.g. still referenced by a job)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+
+            for old_key in list(self.entries):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if old_key == key or old_key in keep:
+                    continue
+                self.total_bytes -= self.entries.pop(old_key)[1]
+
+    def pop(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+# --- RESULT CACHE ---
+# Opt-in memoisation of node outputs, keyed on everything that can change the result.
+# Disk entries survive ComfyUI restarts.
+
+RESULT_CACHE_MODES = ["Off", "Memory", "Memory + Disk"]
+RESULT_CACHE_BYTES = 512 * 1024 * 1024
+RESULT_CACHE_DISK_BYTES = 2 * 1024 * 1024 * 1024 # Least recently used files beyond this are deleted
+RESULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache")
+
+RESULTS = ByteLRU(RESULT_CACHE_BYTES)
+
+def _result_size(outputs):
+    image, text = outputs
+    return image.numel() * image.element_size() + len(text)
+
+def load_result(key, ttl=0, use_disk=False):
+    # Returns the cached (image, text) outputs, or None on a miss or when older than ttl seconds
+    entry = RESULTS.get(key)
+    path = os.path.join(RESULT_CACHE_DIR, f"{key}.pt")
+    if entry is None and use_disk and os.path.exists(path):
+        try:
+            data = torch.load(path, weights_only=True)
+            entry = (data["created"], (data["image"], data["text"]))
+            RESULTS.put(key, entry, _result_size(entry[1]))
+            os.utime(path) # Recently used, see _trim_disk()
+        except Exception as e:
+            print(f"[WebBridge] Could not read cached result {path}: {e}")
+    if entry is None:
+        return None
+    created, outputs = entry
+    if ttl and time.time() - created > ttl:
+        # Stale for good: a fresh result replaces it anyway
+        RESULTS.pop(key)
+        if use_disk:
+            _remove(path)
+        return None
+    return outputs
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[WebBridge] Could not delete cached result {path}: {e}")
+
+def _trim_disk():
+    # Deletes the least recently used files until the disk cache fits RESULT_CACHE_DISK_BYTES
+    entries = []
+    for name in os.listdir(RESULT_CACHE_DIR):
+        if name.endswith(".pt"):
+            stat = os.stat(os.path.join(RESULT_CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= RESULT_CACHE_DISK_BYTES:
+            break
+        _remove(os.path.join(RESULT_CACHE_DIR, name))
+        total -= size
+
+def save_result(key, outputs, use_disk=False):
+    created = time.time()
+    RESULTS.put(key, (created, outputs), _result_size(outputs))
+    if use_disk:
+        try:
+            os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(RESULT_CACHE_DIR, f"{key}.pt")
+            torch.save({"created": created, "image": outputs[0], "text": outputs[1]}, path + ".tmp")
+            os.replace(path + ".tmp", path)
+            _trim_disk()
+        except Exception as e:
+            print(f"[WebBridge] Could not write cached result: {e}")
@@ -0,0 +1,65 @@
+import threading
+import requests
+from collections import OrderedDict
+from io import BytesIO
+from requests.adapters import HTTPAdapter
+
+# Shared HTTP client for downloading result images. Sessions keep TCP/TLS connections
+# alive, so back-to-back downloads from the same CDN skip the handshakes.
+
+DOWNLOAD_TIMEOUT = (5, 30)            # (connect, read) seconds
+MAX_DOWNLOAD_BYTES = 64 * 1024 * 1024 # Refuse anything larger than this
+CHUNK_SIZE = 64 * 1024
+
+# Mimic browser UA
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+MAX_SESSIONS = 16  # Least recently used sessions beyond this are closed
+
+SESSIONS = OrderedDict()  # key -> requests.Session
+SESSIONS_LOCK = threading.Lock()
+
+def get_session(key="default", cookies=None):
+    # cookies ({name: value}) are only applied when the session is created, so callers
+    # with different cookie jars must use different keys
+    with SESSIONS_LOCK:
+        session = SESSIONS.get(key)
+        if session is not None:
+            SESSIONS.move_to_end(key)
+            return session
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = USER_AGENT
+        for name, value in (cookies or {}).items():
+            session.cookies.set(name, value)
+        SESSIONS[key] = session
+
+        while len(SESSIONS) > MAX_SESSIONS:
+            SESSIONS.popitem(last=False)[1].close()
+        return session
+
+def download(url, headers=None, session_key="default", cookies=None, timeout=DOWNLOAD_TIMEOUT, max_bytes=MAX_DOWNLOAD_BYTES, out=None):
+    # Streams the body into out (a writable file, a new BytesIO by default) with a size
+    # guard. Returns out positioned at 0, ready for Image.open without another copy.
+    session = get_session(session_key, cookies)
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            raise Exception(f"Failed to download image from {url}, status: {response.status_code}")
+
+        content_length = int(response.headers.get("Content-Length") or 0)
+        if content_length > max_bytes:
+            raise Exception(f"Image at {url} is {content_length} bytes, limit is {max_bytes}")
+
+        buff = BytesIO() if out is None else out
+        received = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            received += len(chunk)
+            if received > max_bytes:
+                raise Exception(f"Image at {url} exceeds the {max_bytes} byte limit")
+            buff.write(chunk)
+
+    buff.seek(0)
+    return buff
@@ -0,0 +1,115 @@
+import hashlib
+import numpy as np
+import torch
+import torch.nn.functional as F
+from io import BytesIO
+from PIL import Image
+
+# How a batch input is fanned out into separate jobs
+BATCH_MODES = ["Single", "Each Image", "Each Prompt Line"]
+
+# How results of different sizes are combined into one IMAGE batch
+SIZE_POLICIES = ["Resize to First", "Pad to Largest"]
+
+# Codecs for input images sent to the browser. Fast PNG (zlib level 1) is lossless and
+# several times quicker to encode than the default level; JPEG is smallest on the wire.
+UPLOAD_FORMATS = ["PNG (fast)", "PNG", "WebP (lossless)", "JPEG"]
+
+# --- TENSOR <-> IMAGE ---
+
+def tensor_to_uint8(img_tensor):
+    # [H, W, C] or [B, H, W, C] float in 0..1 -> uint8 numpy array.
+    # Quantised in torch on the tensor's device with a single float temporary,
+    # so only the 4x smaller uint8 data is moved to the CPU.
+    with torch.no_grad():
+        return (img_tensor * 255.0).clamp_(0, 255).to(torch.uint8).cpu().numpy()
+
+def hash_image(image):
+    # Content hash of an IMAGE tensor (any batch size) at 8-bit precision
+    pixels = tensor_to_uint8(image)
+    return hashlib.sha256(pixels.tobytes() + str(pixels.shape).encode('utf-8')).hexdigest()
+
+def tensor_to_pil(img_tensor):
+    # img_tensor is a single [H, W, C] image
+    return Image.fromarray(tensor_to_uint8(img_tensor))
+
+def encode_image(img_tensor, upload_format="PNG (fast)", quality=90):
+    # Returns (bytes, mime type) for a single [H, W, C] image
+    return encode_pixels(tensor_to_uint8(img_tensor), upload_format, quality)
+
+def encode_pixels(pixels, upload_format="PNG (fast)", quality=90):
+    # Same as encode_image for an already quantised [H, W, C] uint8 array
+    img = Image.fromarray(pixels)
+    buff = BytesIO()
+    if upload_format == "JPEG":
+        img.convert("RGB").save(buff, format="JPEG", quality=quality)
+        return buff.getvalue(), "image/jpeg"
+    if upload_format == "WebP (lossless)":
+        img.save(buff, format="WEBP", lossless=True, method=0)
+        return buff.getvalue(), "image/webp"
+    if upload_format == "PNG":
+        img.save(buff, format="PNG")
+    else:
+        img.save(buff, format="PNG", compress_level=1)
+    return buff.getvalue(), "image/png"
+
+def pil_to_tensor(img, out=None):
+    # PIL image -> [1, H, W, 3] float tensor. With out (a preallocated [H, W, 3] float
+    # tensor) the pixels are converted straight into it.
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    pixels = torch.from_numpy(np.array(img)) # uint8, the only intermediate copy
+    if out is None:
+        out = torch.empty(pixels.shape, dtype=torch.float32)
+    out.copy_(pixels).div_(255.0)
+    return out.unsqueeze(0)
+
+def pil_batch_to_tensor(images, policy="Resize to First"):
+    # List of PIL images -> one [B, H, W, 3] tensor. When all sizes match, every image
+    # is decoded into its slot of one preallocated batch instead of being concatenated.
+    if len({img.size for img in images}) == 1:
+        width, height = images[0].size
+        batch = torch.empty((len(images), height, width, 3), dtype=torch.float32)
+        for i, img in enumerate(images):
+            pil_to_tensor(img, out=batch[i])
+        return batch
+    return stack_images([pil_to_tensor(img) for img in images], policy)
+
+# --- BATCHES ---
+
+def stack_images(images, policy="Resize to First"):
+    # images: list of [1, H, W, C] tensors -> one [B, H, W, C] tensor
+    if len(images) == 1:
+        return images[0]
+
+    if policy == "Pad to Largest":
+        height = max(img.shape[1] for img in images)
+        width = max(img.shape[2] for img in images)
+        batch = []
+        for img in images:
+            dh = height - img.shape[1]
+            dw = width - img.shape[2]
+            # F.pad takes pairs from the last dim backwards: C, W, H. Center the image.
+            batch.append(F.pad(img, (0, 0, dw // 2, dw - dw // 2, dh // 2, dh - dh // 2)))
+    else:
+        height, width = images[0].shape[1], images[0].shape[2]
+        batch = []
+        for img in images:
+            if img.shape[1] != height or img.shape[2] != width:
+                img = F.interpolate(img.movedim(-1, 1), size=(height, width), mode="bilinear", align_corners=False).movedim(1, -1)
+            batch.append(img)
+
+    return torch.cat(batch, dim=0)
+
+def split_batch(prompt, image, batch_mode):
+    # Returns a list of (prompt, image_tensor_or_None) pairs, one per job.
+    # image is a [B, H, W, C] IMAGE; the items carry single [H, W, C] images.
+    if batch_mode == "Each Prompt Line":
+        lines = [line.strip() for line in prompt.splitlines() if line.strip()] or [prompt]
+        first = image[0] if image is not None else None
+        return [(line, first) for line in lines]
+
+    if batch_mode == "Each Image" and image is not None:
+        return [(prompt, image[i]) for i in range(image.shape[0])]
+
+    return [(prompt, image[0] if image is not None else None)]
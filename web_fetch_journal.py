@@ -0,0 +1,88 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# On-disk record of bridge jobs, so a ComfyUI restart does not lose work a browser tab
+# is doing or has already finished. Rows are written on submit, claim and result and
+# removed once the node consumed the job. At start the surviving rows are replayed and
+# a re-run of the same node picks up the finished (or still running) job instead of
+# asking the site again.
+
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_journal.sqlite3")
+JOURNAL_TTL = 24 * 3600 # Seconds a job that nobody picks up again is kept
+
+class JobJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+        try:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, match_key TEXT, job TEXT, worker TEXT, created REAL,
+                finished REAL, result_type TEXT, result_text TEXT, error TEXT)""")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS images (
+                job_id TEXT, idx INTEGER, data BLOB, PRIMARY KEY (job_id, idx))""")
+        except Exception as e:
+            print(f"[WebBridge] Job journal disabled, could not open {path}: {e}")
+            self.conn = None
+
+    def _execute(self, *statements):
+        # statements: (sql, params) pairs run in one transaction. Journal errors are
+        # logged and never fail the job itself.
+        if self.conn is None:
+            return
+        with self.lock:
+            try:
+                self.conn.execute("BEGIN")
+                for sql, params in statements:
+                    self.conn.execute(sql, params)
+                self.conn.execute("COMMIT")
+            except Exception as e:
+                self.conn.execute("ROLLBACK")
+                print(f"[WebBridge] Job journal write failed: {e}")
+
+    def submit(self, job_id, match_key, job, created):
+        self._execute(("INSERT OR REPLACE INTO jobs (id, match_key, job, created) VALUES (?, ?, ?, ?)",
+                       (job_id, match_key, json.dumps(job), created)))
+
+    def claim(self, job_id, worker_id):
+        self._execute(("UPDATE jobs SET worker = ? WHERE id = ?", (worker_id, job_id)))
+
+    def finish(self, job_id, result_type=None, text=None, images=(), error=None):
+        # images: encoded image bytes
+        statements = [("UPDATE jobs SET finished = ?, result_type = ?, result_text = ?, error = ? WHERE id = ?",
+                       (time.time(), result_type, text, error, job_id))]
+        statements += [("INSERT OR REPLACE INTO images (job_id, idx, data) VALUES (?, ?, ?)", (job_id, i, sqlite3.Binary(data)))
+                       for i, data in enumerate(images)]
+        self._execute(*statements)
+
+    def remove(self, job_id):
+        self._execute(("DELETE FROM jobs WHERE id = ?", (job_id,)),
+                      ("DELETE FROM images WHERE job_id = ?", (job_id,)))
+
+    def replay(self):
+        # Drops expired and never claimed jobs (nothing was generated for those yet) and
+        # returns the rest, oldest first, with their result images as bytes
+        if self.conn is None:
+            return []
+        cutoff = time.time() - JOURNAL_TTL
+        self._execute(("DELETE FROM jobs WHERE created < ? OR (worker IS NULL AND finished IS NULL)", (cutoff,)),
+                      ("DELETE FROM images WHERE job_id NOT IN (SELECT id FROM jobs)", ()))
+        with self.lock:
+            rows = self.conn.execute("SELECT id, match_key, job, worker, created, finished, result_type, result_text, error FROM jobs ORDER BY created").fetchall()
+            entries = []
+            for job_id, match_key, job, worker, created, finished, result_type, text, error in rows:
+                images = [data for (data,) in self.conn.execute("SELECT data FROM images WHERE job_id = ? ORDER BY idx", (job_id,))]
+                entries.append({
+                    "id": job_id, "match_key": match_key, "job": json.loads(job), "worker": worker,
+                    "created": created, "finished": finished, "result_type": result_type,
+                    "text": text, "error": error, "images": images,
+                })
+        return entries
+
+JOURNAL = JobJournal(JOURNAL_PATH)
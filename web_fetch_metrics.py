@@ -0,0 +1,99 @@
+import threading
+from collections import deque
+
+# Per-phase latency of bridge jobs, labelled by site and mode. Cumulative buckets feed
+# the Prometheus histograms on /metrics; a window of recent samples gives the
+# percentiles on /stats.
+
+# Job phases in pipeline order:
+#   queue    job posted -> claimed by a tab             (bridge)
+#   input    input image fetched and put into the page  (browser)
+#   type     prompt typed                               (browser)
+#   click    generate clicked, page reacting            (browser)
+#   result   result detected on the page                (browser)
+#   collect  result read from the page                  (browser)
+#   upload   result body received                       (bridge)
+#   decode   result parsed / downloaded                 (bridge)
+#   tensor   images decoded into the IMAGE batch        (node)
+#   total    job posted -> result available             (bridge)
+PHASES = ("queue", "input", "type", "click", "result", "collect", "upload", "decode", "tensor", "total")
+
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0) # Seconds
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW = 1024 # Recent samples kept per series for the percentiles
+
+class PhaseHistogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS) # Cumulative counts, like Prometheus
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=WINDOW)
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def quantiles(self):
+        samples = sorted(self.recent)
+        if not samples:
+            return {}
+        return {q: samples[min(int(q * len(samples)), len(samples) - 1)] for q in QUANTILES}
+
+HISTOGRAMS = {} # (phase, site, mode) -> PhaseHistogram
+LOCK = threading.Lock()
+
+def observe(phase, site, mode, seconds):
+    if phase not in PHASES or seconds is None or seconds < 0:
+        return
+    key = (phase, site or "unknown", mode or "unknown")
+    with LOCK:
+        histogram = HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = HISTOGRAMS[key] = PhaseHistogram()
+        histogram.observe(seconds)
+
+def stats():
+    # {site: {mode: {phase: {"count", "mean", "p50", "p95", "p99"}}}} in seconds
+    out = {}
+    with LOCK:
+        for (phase, site, mode), histogram in sorted(HISTOGRAMS.items(), key=lambda item: (item[0][1], item[0][2], PHASES.index(item[0][0]))):
+            entry = {"count": histogram.count, "mean": round(histogram.sum / histogram.count, 4)}
+            for q, value in histogram.quantiles().items():
+                entry[f"p{int(q * 100)}"] = round(value, 4)
+            out.setdefault(site, {}).setdefault(mode, {})[phase] = entry
+    return out
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def render_prometheus(gauges=None):
+    # gauges: {name: (help, value)} appended as plain gauges
+    lines = [
+        "# HELP webbridge_phase_seconds Latency of each job phase.",
+        "# TYPE webbridge_phase_seconds histogram",
+    ]
+    quantile_lines = []
+    with LOCK:
+        for (phase, site, mode), histogram in sorted(HISTOGRAMS.items()):
+            labels = f'phase="{_label(phase)}",site="{_label(site)}",mode="{_label(mode)}"'
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                lines.append(f'webbridge_phase_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'webbridge_phase_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'webbridge_phase_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'webbridge_phase_seconds_count{{{labels}}} {histogram.count}')
+            for q, value in histogram.quantiles().items():
+                quantile_lines.append(f'webbridge_phase_quantile_seconds{{{labels},quantile="{q}"}} {value}')
+
+    lines.append("# HELP webbridge_phase_quantile_seconds Percentiles of each job phase over recent jobs.")
+    lines.append("# TYPE webbridge_phase_quantile_seconds gauge")
+    lines.extend(quantile_lines)
+
+    for name, (help_text, value) in (gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
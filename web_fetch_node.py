@@ -1,13 +1,17 @@
-import torch
-import numpy as np
 from PIL import Image
 import os
 import time
+import atexit
+import threading
 import tempfile
 import logging
 import io
-import requests
+import json
+import hashlib
 from io import BytesIO
+from urllib.parse import urlsplit
+from .web_fetch_images import BATCH_MODES, SIZE_POLICIES, UPLOAD_FORMATS, encode_image, pil_to_tensor, split_batch, stack_images
+from .web_fetch_http import download
 
 # Try importing selenium, handle missing dependency graceously
 try:
@@ -21,6 +25,185 @@ except ImportError:
     webdriver = None
     print("Selenium not installed. Please install requirements.txt")
 
+# --- DRIVER POOL ---
+# One WebDriver session per (browser type, debug port, profile), reused across executions
+# instead of attaching/launching every time. Sessions are health-checked before reuse,
+# closed after DRIVER_IDLE_SECONDS without use, and shut down when ComfyUI exits.
+
+DRIVER_IDLE_SECONDS = 600
+DRIVER_POOL = {}  # key -> {"driver": ..., "attached": bool, "lock": threading.Lock(), "last_used": ...}
+DRIVER_POOL_LOCK = threading.Lock()
+
+def _create_driver(browser_type, remote_debugging_port, firefox_profile_path):
+    if browser_type == "Chrome/Edge (Attach)":
+        chrome_options = Options()
+        chrome_options.add_experimental_option("debuggerAddress", f"127.0.0.1:{remote_debugging_port}")
+        try:
+            return webdriver.Chrome(options=chrome_options)
+        except Exception as e:
+            raise Exception(f"Could not connect to Chrome/Edge at port {remote_debugging_port}. Make sure it is running with '--remote-debugging-port={remote_debugging_port}'. Error: {e}")
+    
+    elif browser_type == "Firefox (New Window)":
+        try:
+            from selenium.webdriver.firefox.options import Options as FirefoxOptions
+            from selenium.webdriver.firefox.service import Service as FirefoxService
+            
+            options = FirefoxOptions()
+            
+            # If a profile is provided, use it to keep login state
+            if firefox_profile_path and os.path.exists(firefox_profile_path):
+                options.add_argument("-profile")
+                options.add_argument(firefox_profile_path)
+            
+            # Note: This launches a NEW instance. Attaching to existing Firefox is difficult.
+            # If the user points to an existing profile that is currently in use, Firefox might error 
+            # or open a new window sharing the session.
+            
+            # We assume geckodriver is in path or installed via pip? 
+            # Providing a service object is safer if we want to suppress logs etc.
+            return webdriver.Firefox(options=options)
+            
+        except Exception as e:
+             raise Exception(f"Failed to launch Firefox. Ensure 'geckodriver' is installed and in your PATH. Error: {e}")
+
+    raise Exception("Driver initialization failed.")
+
+def _driver_alive(driver):
+    try:
+        driver.window_handles
+        return True
+    except Exception:
+        return False
+
+def _close_driver(entry):
+    driver = entry["driver"]
+    entry["driver"] = None
+    if driver is None:
+        return
+    try:
+        if entry["attached"]:
+            # Only stop chromedriver; the attached browser belongs to the user
+            driver.service.stop()
+        else:
+            driver.quit()
+    except Exception as e:
+        print(f"[WebFetch] Error closing driver: {e}")
+
+def acquire_driver(browser_type, remote_debugging_port=9222, firefox_profile_path=""):
+    # Returns (entry, fresh). The entry stays locked until release_driver().
+    if webdriver is None:
+        raise ImportError("Selenium is not installed. Please install it to use this node.")
+
+    key = (browser_type, remote_debugging_port if browser_type == "Chrome/Edge (Attach)" else None, firefox_profile_path or "")
+    while True:
+        with DRIVER_POOL_LOCK:
+            entry = DRIVER_POOL.get(key)
+            if entry is None:
+                entry = {"driver": None, "attached": browser_type == "Chrome/Edge (Attach)", "lock": threading.Lock(), "last_used": time.time()}
+                DRIVER_POOL[key] = entry
+
+        entry["lock"].acquire()
+        with DRIVER_POOL_LOCK:
+            if DRIVER_POOL.get(key) is entry:
+                break
+        # Evicted between the lookup and the lock; a driver started in it now would be
+        # out of reach of the reaper and atexit, so start over with a pooled entry
+        entry["lock"].release()
+
+    try:
+        if entry["driver"] is not None and not _driver_alive(entry["driver"]):
+            print("[WebFetch] Pooled driver is no longer responding. Reconnecting.")
+            _close_driver(entry)
+        fresh = entry["driver"] is None
+        if fresh:
+            entry["driver"] = _create_driver(browser_type, remote_debugging_port, firefox_profile_path)
+        return entry, fresh
+    except Exception:
+        entry["lock"].release()
+        raise
+
+def release_driver(entry):
+    entry["last_used"] = time.time()
+    entry["lock"].release()
+
+def evict_idle_drivers():
+    now = time.time()
+    with DRIVER_POOL_LOCK:
+        for key, entry in list(DRIVER_POOL.items()):
+            if now - entry["last_used"] > DRIVER_IDLE_SECONDS and entry["lock"].acquire(blocking=False):
+                try:
+                    _close_driver(entry)
+                    del DRIVER_POOL[key]
+                finally:
+                    entry["lock"].release()
+
+def shutdown_drivers():
+    with DRIVER_POOL_LOCK:
+        for entry in DRIVER_POOL.values():
+            _close_driver(entry)
+        DRIVER_POOL.clear()
+
+def _driver_reaper():
+    while True:
+        time.sleep(60)
+        evict_idle_drivers()
+
+atexit.register(shutdown_drivers)
+threading.Thread(target=_driver_reaper, daemon=True).start()
+
+# --- IN-PAGE HEURISTICS ---
+# Each scan runs as one execute_script call instead of one WebDriver round trip per
+# element and attribute.
+
+FIND_PROMPT_JS = """
+// One combined selector, so every element is scored once
+const candidates = [...document.querySelectorAll("textarea, input[type='text'], [contenteditable='true'], [role='textbox']")];
+let best = null, bestScore = -1;
+for (const el of candidates) {
+    const rect = el.getBoundingClientRect();
+    if (!rect.width || !rect.height || getComputedStyle(el).visibility === 'hidden') continue;
+    const text = ((el.getAttribute('placeholder') || '') + (el.getAttribute('aria-label') || '') + el.outerHTML).toLowerCase();
+    let score = 0;
+    if (text.includes('prompt')) score += 10;
+    if (text.includes('chat')) score += 5;
+    if (text.includes('message')) score += 5;
+    if (text.includes('search')) score += 2;
+    if (el.tagName === 'TEXTAREA') score += 5;
+    if (el.getAttribute('contenteditable') === 'true') score += 5;
+    score += (rect.width * rect.height) / 10000;
+    if (score > bestScore) { bestScore = score; best = el; }
+}
+const debug = candidates.slice(0, 5).map(el => `${el.tagName.toLowerCase()} (id=${el.id}, class=${el.className})`);
+return [best, best ? bestScore : null, debug];
+"""
+
+SUBMIT_KEYWORDS = ["generate", "run", "create", "submit", "dream"]
+
+FIND_SUBMIT_JS = """
+const keywords = arguments[0];
+const visible = el => { const r = el.getBoundingClientRect(); return r.width > 0 && r.height > 0 && getComputedStyle(el).visibility !== 'hidden'; };
+for (const btn of document.querySelectorAll('button')) {
+    if (!visible(btn)) continue;
+    const txt = (btn.innerText || '').toLowerCase();
+    if (keywords.some(k => txt.includes(k))) return btn;
+}
+for (const inp of document.querySelectorAll("input[type='submit']")) {
+    if (visible(inp)) return inp;
+}
+return null;
+"""
+
+IMAGE_URLS_JS = """
+const selector = arguments[0];
+const els = selector ? [...document.querySelectorAll(selector)].filter(el => el.getClientRects().length > 0) : [...document.images];
+const urls = new Set();
+for (const el of els) {
+    const src = el.src || el.getAttribute('src');
+    if (src) urls.add(src);
+}
+return [...urls];
+"""
+
 class WebFetchNode:
     def __init__(self):
         pass
@@ -42,6 +225,13 @@ class WebFetchNode:
                 "manual_upload_selector": ("STRING", {"default": ""}),
                 "manual_submit_selector": ("STRING", {"default": ""}),
                 "manual_result_img_selector": ("STRING", {"default": ""}),
+                "batch_mode": (BATCH_MODES,),
+                "size_policy": (SIZE_POLICIES,),
+                "result_images": (["First", "All"],),
+                "upload_format": (UPLOAD_FORMATS,),
+                "upload_quality": ("INT", {"default": 90, "min": 1, "max": 100}),
+                "download_timeout": ("INT", {"default": 30, "min": 1, "max": 600}), # Seconds without data before a result download fails
+                "max_download_mb": ("INT", {"default": 64, "min": 1, "max": 1024}),
             }
         }
 
@@ -51,89 +241,64 @@ class WebFetchNode:
     CATEGORY = "WebFetch"
 
     def fetch_from_web(self, browser_type, prompt, tab_index, image=None, remote_debugging_port=9222, firefox_profile_path="", time_limit=30, 
-                       manual_prompt_selector="", manual_upload_selector="", manual_submit_selector="", manual_result_img_selector=""):
-        
-        if webdriver is None:
-            raise ImportError("Selenium is not installed. Please install it to use this node.")
-
-        driver = None
-        
-        # 1. Connect/Launch Browser
-        if browser_type == "Chrome/Edge (Attach)":
-            chrome_options = Options()
-            chrome_options.add_experimental_option("debuggerAddress", f"127.0.0.1:{remote_debugging_port}")
-            try:
-                driver = webdriver.Chrome(options=chrome_options)
-            except Exception as e:
-                raise Exception(f"Could not connect to Chrome/Edge at port {remote_debugging_port}. Make sure it is running with '--remote-debugging-port={remote_debugging_port}'. Error: {e}")
+                       manual_prompt_selector="", manual_upload_selector="", manual_submit_selector="", manual_result_img_selector="",
+                       batch_mode="Single", size_policy="Resize to First", result_images="First",
+                       upload_format="PNG (fast)", upload_quality=90, download_timeout=30, max_download_mb=64):
         
-        elif browser_type == "Firefox (New Window)":
-            try:
-                from selenium.webdriver.firefox.options import Options as FirefoxOptions
-                from selenium.webdriver.firefox.service import Service as FirefoxService
-                
-                options = FirefoxOptions()
-                
-                # If a profile is provided, use it to keep login state
-                if firefox_profile_path and os.path.exists(firefox_profile_path):
-                    options.add_argument("-profile")
-                    options.add_argument(firefox_profile_path)
-                
-                # Note: This launches a NEW instance. Attaching to existing Firefox is difficult.
-                # If the user points to an existing profile that is currently in use, Firefox might error 
-                # or open a new window sharing the session.
-                
-                # We assume geckodriver is in path or installed via pip? 
-                # Providing a service object is safer if we want to suppress logs etc.
-                driver = webdriver.Firefox(options=options)
-                
-            except Exception as e:
-                 raise Exception(f"Failed to launch Firefox. Ensure 'geckodriver' is installed and in your PATH. Error: {e}")
-
-        if not driver:
-             raise Exception("Driver initialization failed.")
+        # 1. Connect/Launch Browser (reused from the pool when still alive)
+        entry, fresh = acquire_driver(browser_type, remote_debugging_port, firefox_profile_path)
+        driver = entry["driver"]
 
         try:
-            # 2. Switch to Tab
-            # For Firefox new window, there might only be one tab effectively, or restored session tabs.
-            # We wait a bit for pages to load if it's a fresh launch
-            if browser_type == "Firefox (New Window)":
-                time.sleep(2) 
+            try:
+                # 2. Switch to Tab
+                # For Firefox new window, there might only be one tab effectively, or restored session tabs.
+                # We wait a bit for pages to load if it's a fresh launch
+                if browser_type == "Firefox (New Window)" and fresh:
+                    time.sleep(2) 
             
-            handles = driver.window_handles
-            if tab_index >= len(handles):
-                 # If only 1 tab exists and index is > 0, maybe user wants to open a new tab? 
-                 # For now, stick to strict index.
-                 if len(handles) == 1 and tab_index == 0:
-                     pass # Success
-                 else:
-                     print(f"Warning: Tab index {tab_index} out of range (Found {len(handles)} tabs). Using current tab.")
-            else:
-                driver.switch_to.window(handles[tab_index])
+                handles = driver.window_handles
+                if tab_index >= len(handles):
+                     # If only 1 tab exists and index is > 0, maybe user wants to open a new tab? 
+                     # For now, stick to strict index.
+                     if len(handles) == 1 and tab_index == 0:
+                         pass # Success
+                     else:
+                         print(f"Warning: Tab index {tab_index} out of range (Found {len(handles)} tabs). Using current tab.")
+                else:
+                    driver.switch_to.window(handles[tab_index])
             
-            print(f"Connected to tab: {driver.title}")
+                print(f"Connected to tab: {driver.title}")
 
-            # ... Rest of execution same as before ... 
+            except Exception as e:
+                raise Exception(f"Failed to switch to tab {tab_index}: {e}")
 
-        except Exception as e:
-            raise Exception(f"Failed to switch to tab {tab_index}: {e}")
+            # 3. Run one generation per batch element, in this tab, one after another
+            images = []
+            for item_prompt, img_tensor in split_batch(prompt, image, batch_mode):
+                images.extend(self.run_in_tab(driver, item_prompt, img_tensor, time_limit,
+                                              manual_prompt_selector, manual_upload_selector, manual_submit_selector, manual_result_img_selector,
+                                              collect_all=(result_images == "All"), upload_format=upload_format, upload_quality=upload_quality,
+                                              download_timeout=download_timeout, max_download_mb=max_download_mb))
+            return (stack_images(images, size_policy),)
+        finally:
+            release_driver(entry)
 
-        # 3. Handle Image Upload
-        if image is not None:
+    def run_in_tab(self, driver, prompt, img_tensor, time_limit,
+                   manual_prompt_selector="", manual_upload_selector="", manual_submit_selector="", manual_result_img_selector="",
+                   collect_all=False, upload_format="PNG (fast)", upload_quality=90, download_timeout=30, max_download_mb=64):
+        # Returns a list of [1, H, W, 3] result tensors
+        # 1. Handle Image Upload
+        if img_tensor is not None:
             try:
                 # Convert tensor to temporary file
-                # image is items, height, width, channel (Check comfy format)
-                # Usually [1, H, W, 3]
-                
-                # Take the first image in the batch
-                img_tensor = image[0] 
-                i = 255. * img_tensor.cpu().numpy()
-                img_pil = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+                # img_tensor is a single [H, W, 3] image of the batch
+                img_bytes, mime = encode_image(img_tensor, upload_format, upload_quality)
                 
                 # Save to temp file
-                with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tf:
+                with tempfile.NamedTemporaryFile(suffix="." + mime.split("/")[1], delete=False) as tf:
                     img_path = tf.name
-                    img_pil.save(img_path)
+                    tf.write(img_bytes)
                 
                 # Find upload input
                 file_input = None
@@ -161,64 +326,19 @@ class WebFetchNode:
                 # For safety in this script, we won't delete immediately to ensure browser grabbed it.
                 pass
 
-        # 4. Handle Prompt
+        # 2. Handle Prompt
         try:
             prompt_input = None
+            best_score = None
+            candidates = []
             if manual_prompt_selector:
                 prompt_input = driver.find_element(By.CSS_SELECTOR, manual_prompt_selector)
             else:
-                # Heuristics:
+                # Heuristics, scored inside the page in one round trip:
                 # Priority 1: Textarea with 'prompt' in id, name, or placeholder
                 # Priority 2: contenteditable divs (common in modern chat apps)
                 # Priority 3: Input[text]
-                
-                candidates = (
-                    driver.find_elements(By.TAG_NAME, "textarea") + 
-                    driver.find_elements(By.CSS_SELECTOR, "input[type='text']") +
-                    driver.find_elements(By.CSS_SELECTOR, "[contenteditable='true']") +
-                    driver.find_elements(By.CSS_SELECTOR, "[role='textbox']")
-                )
-                
-                best_candidate = None
-                best_score = -1
-                
-                unique_candidates = {el._id: el for el in candidates}.values() # Remove dupes
-                
-                for el in unique_candidates:
-                    try:
-                        if not el.is_displayed(): continue
-                        score = 0
-                        
-                        # Get attributes for scoring
-                        outer_html = el.get_attribute("outerHTML").lower()
-                        placeholder = el.get_attribute("placeholder") or ""
-                        aria_label = el.get_attribute("aria-label") or ""
-                        
-                        text_content = (placeholder + aria_label + outer_html).lower()
-                        
-                        # Keywords
-                        if "prompt" in text_content: score += 10
-                        if "chat" in text_content: score += 5
-                        if "message" in text_content: score += 5
-                        if "search" in text_content: score += 2 # Sometimes search bars are prompts
-                        
-                        # Type boosting
-                        tag_name = el.tag_name.lower()
-                        if tag_name == "textarea": score += 5
-                        if el.get_attribute("contenteditable") == "true": score += 5
-                        
-                        # Size matters (often the main prompt box is big)
-                        size = el.size
-                        area = size['width'] * size['height']
-                        score += (area / 10000) # Small weight for size
-                        
-                        if score > best_score:
-                            best_score = score
-                            best_candidate = el
-                    except:
-                        continue
-                
-                prompt_input = best_candidate
+                prompt_input, best_score, candidates = driver.execute_script(FIND_PROMPT_JS)
 
             if prompt_input:
                 # Clear and send keys
@@ -242,55 +362,35 @@ class WebFetchNode:
             else:
                 # Log visible text inputs to help user debug
                 debug_msg = "Could not find a prompt input text box. Detected candidates:\n"
-                for el in candidates[:5]:
-                    try:
-                        debug_msg += f"- {el.tag_name} (id={el.get_attribute('id')}, class={el.get_attribute('class')})\n"
-                    except: pass
+                for description in candidates:
+                    debug_msg += f"- {description}\n"
                 print(debug_msg)
                 raise Exception("Could not find a prompt input text box. Try using 'manual_prompt_selector'.")
 
         except Exception as e:
             raise Exception(f"Error entering prompt: {e}")
 
-        # 5. Find and Click Submit/Run
+        # 3. Find and Click Submit/Run
         try:
             submit_btn = None
             if manual_submit_selector:
                 submit_btn = driver.find_element(By.CSS_SELECTOR, manual_submit_selector)
             else:
-                # Heuristics: Button containing specific keywords
-                keywords = ["generate", "run", "create", "submit", "dream"]
-                buttons = driver.find_elements(By.TAG_NAME, "button")
-                
-                for btn in buttons:
-                    if not btn.is_displayed(): continue
-                    txt = btn.text.lower()
-                    if any(k in txt for k in keywords):
-                        submit_btn = btn
-                        break
-                
-                # If no button tag, check inputs type=submit
-                if not submit_btn:
-                    inputs = driver.find_elements(By.CSS_SELECTOR, "input[type='submit']")
-                    if inputs:
-                         # Filter visible
-                         for inp in inputs:
-                             if inp.is_displayed():
-                                 submit_btn = inp
-                                 break
+                # Heuristics: Button containing specific keywords, else a visible input type=submit
+                submit_btn = driver.execute_script(FIND_SUBMIT_JS, SUBMIT_KEYWORDS)
             
             if submit_btn:
                 # Record existing images state before clicking
-                initial_images = self.get_all_image_urls(driver)
+                initial_images = set(self.get_all_image_urls(driver))
                 
                 submit_btn.click()
                 print("Clicked submit.")
                 
-                # 6. Wait for result
-                result_image = self.wait_for_new_image(driver, initial_images, time_limit, manual_result_img_selector)
+                # 4. Wait for result
+                result_urls = self.wait_for_new_images(driver, initial_images, time_limit, manual_result_img_selector, collect_all)
                 
-                if result_image:
-                    return (self.load_image_from_url(result_image, driver),)
+                if result_urls:
+                    return [self.load_image_from_url(url, driver, download_timeout, max_download_mb) for url in result_urls]
                 else:
                     raise Exception("Timed out waiting for new image result.")
             else:
@@ -299,50 +399,36 @@ class WebFetchNode:
         except Exception as e:
             raise Exception(f"Execution failed: {e}")
 
-    def get_all_image_urls(self, driver):
-        imgs = driver.find_elements(By.TAG_NAME, "img")
-        urls = set()
-        for img in imgs:
-            try:
-                src = img.get_attribute("src")
-                if src:
-                    urls.add(src)
-            except:
-                pass
-        return urls
+    def get_all_image_urls(self, driver, selector=""):
+        # Image URLs in page order, without duplicates, in one round trip.
+        # With a selector only visible matching elements are considered.
+        try:
+            return driver.execute_script(IMAGE_URLS_JS, selector or None)
+        except:
+            return []
 
-    def wait_for_new_image(self, driver, initial_images, timeout, selector=""):
+    def wait_for_new_images(self, driver, initial_images, timeout, selector="", collect_all=False, settle_time=3.0):
+        # Returns new image URLs in page order. With collect_all, keeps watching until
+        # no further new image appeared for settle_time seconds.
         start_time = time.time()
+        found = []
+        last_change = start_time
         while time.time() - start_time < timeout:
-            if selector:
-                try:
-                    el = driver.find_element(By.CSS_SELECTOR, selector)
-                    if el.is_displayed():
-                        src = el.get_attribute("src")
-                        if src and (src not in initial_images or len(initial_images) == 0):
-                            return src
-                except:
-                    pass
-            else:
-                current_images = self.get_all_image_urls(driver)
-                new_images = current_images - initial_images
-                
-                if new_images:
-                    print(f"Found new images: {new_images}")
-                    for src in new_images:
-                        try:
-                            # Verify image size to avoid icons
-                            # We can't easily check size by URL without downloading headers,
-                            # so we find the element again.
-                            # Just grabbing the first new one is usually fine for these tools.
-                            return src
-                        except:
-                            continue
+            current = self.get_all_image_urls(driver, selector)
+
+            new_images = [src for src in current if src not in initial_images]
+            if new_images != found:
+                print(f"Found new images: {new_images}")
+                found = new_images
+                last_change = time.time()
+
+            if found and (not collect_all or time.time() - last_change >= settle_time):
+                return found if collect_all else found[:1]
                             
             time.sleep(1.0)
-        return None
+        return found
 
-    def load_image_from_url(self, url, driver=None):
+    def load_image_from_url(self, url, driver=None, timeout=30, max_mb=64):
         # Handle data: URLs
         if url.startswith("data:image"):
             import base64
@@ -352,28 +438,19 @@ class WebFetchNode:
             img = Image.open(BytesIO(img_bytes))
         else:
             # Handle http/https with cookies from selenium
-            session = requests.Session()
+            cookies = {}
             if driver:
                 try:
-                    selenium_cookies = driver.get_cookies()
-                    for cookie in selenium_cookies:
-                        session.cookies.set(cookie['name'], cookie['value'])
+                    cookies = {cookie['name']: cookie['value'] for cookie in driver.get_cookies()}
                 except:
                     pass # Ignore if cookie retrieval fails
-            
-            # Mimic browser UA
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response = session.get(url, headers=headers)
-            
-            if response.status_code != 200:
-                raise Exception(f"Failed to download image from {url}, status: {response.status_code}")
 
-            img = Image.open(BytesIO(response.content))
+            # One pooled session per (host, cookie jar): repeated downloads from the same CDN
+            # reuse the open connection instead of a new TCP/TLS handshake each time
+            jar_hash = hashlib.sha256(json.dumps(cookies, sort_keys=True).encode('utf-8')).hexdigest()
+            session_key = (urlsplit(url).hostname, jar_hash)
+            img = Image.open(download(url, session_key=session_key, cookies=cookies,
+                                      timeout=(5, timeout), max_bytes=max_mb * 1024 * 1024))
 
         # Convert to ComfyUI format (Tensor [1, H, W, 3])
-        img = img.convert("RGB")
-        img = np.array(img).astype(np.float32) / 255.0
-        img = torch.from_numpy(img)[None,]
-        return img
+        return pil_to_tensor(img)
@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+
+# Per-site selector profiles, shared by every tab and machine talking to this bridge.
+# A profile maps roles (prompt, submit, upload, text) to CSS selectors and may carry
+# scheduler limits for the site (see web_fetch_scheduler). Every change
+# bumps its version; writers send the version they started from, so a stale tab cannot
+# silently overwrite a newer profile. Stored as one JSON file that can be copied around.
+
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "site_profiles.json")
+PROFILE_ROLES = ("prompt", "submit", "upload", "text")
+PROFILE_LIMITS = ("concurrency", "per_minute", "burst") # See web_fetch_scheduler
+
+PROFILES = {} # site -> {"site": ..., "version": int, "updated": float, "selectors": {role: selector}, "limits": {...}}
+PROFILES_LOCK = threading.Lock()
+
+class ProfileConflict(Exception):
+    def __init__(self, profile):
+        super().__init__(f"Profile for {profile['site']} is at version {profile['version']}")
+        self.profile = profile
+
+def load_profiles():
+    if not os.path.exists(PROFILES_PATH):
+        return
+    try:
+        with open(PROFILES_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with PROFILES_LOCK:
+            PROFILES.clear()
+            PROFILES.update(data)
+        print(f"[WebBridge] Loaded {len(data)} site profile(s).")
+    except Exception as e:
+        print(f"[WebBridge] Could not read {PROFILES_PATH}: {e}")
+
+def _write_profiles():
+    # Lock must be held
+    try:
+        with open(PROFILES_PATH + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(PROFILES, f, indent=2, sort_keys=True)
+        os.replace(PROFILES_PATH + ".tmp", PROFILES_PATH)
+    except Exception as e:
+        print(f"[WebBridge] Could not write site profiles: {e}")
+
+def get_profile(site):
+    with PROFILES_LOCK:
+        profile = PROFILES.get(site)
+        return json.loads(json.dumps(profile)) if profile else None
+
+def get_limits(site):
+    # Scheduler limits of a site, read on every claim, so no copy
+    with PROFILES_LOCK:
+        profile = PROFILES.get(site)
+        return profile.get("limits") if profile else None
+
+def list_profiles():
+    with PROFILES_LOCK:
+        return json.loads(json.dumps(PROFILES))
+
+def update_profile(site, selectors, version=None, limits=None):
+    # selectors: {role: selector}, a None/empty selector removes the role.
+    # limits: {name: number}, 0/None removes the limit.
+    # version: the version the change is based on; None skips the check.
+    if not site:
+        raise Exception("Profile needs a site")
+    for role in selectors:
+        if role not in PROFILE_ROLES:
+            raise Exception(f"Unknown selector role: {role}")
+    for name in (limits or {}):
+        if name not in PROFILE_LIMITS:
+            raise Exception(f"Unknown limit: {name}")
+    with PROFILES_LOCK:
+        profile = PROFILES.get(site) or {"site": site, "version": 0, "updated": 0, "selectors": {}}
+        if version is not None and int(version) != profile["version"]:
+            raise ProfileConflict(json.loads(json.dumps(profile)))
+
+        for role, selector in selectors.items():
+            if selector:
+                profile["selectors"][role] = str(selector)
+            else:
+                profile["selectors"].pop(role, None)
+
+        for name, value in (limits or {}).items():
+            if value:
+                profile.setdefault("limits", {})[name] = float(value) if name == "per_minute" else int(value)
+            elif "limits" in profile:
+                profile["limits"].pop(name, None)
+
+        profile["version"] += 1
+        profile["updated"] = time.time()
+        PROFILES[site] = profile
+        _write_profiles()
+        print(f"[WebBridge] Site profile for {site} updated to version {profile['version']}.")
+        return json.loads(json.dumps(profile))
+
+load_profiles()
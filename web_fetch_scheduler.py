@@ -0,0 +1,75 @@
+import random
+
+# Admission and retry policy of the bridge. Per site (the host of the claiming tab) a job
+# may only start while fewer than "concurrency" jobs run there and a token is left in the
+# site's bucket ("per_minute" refill, "burst" capacity). Limits come from the site
+# profile, e.g. {"limits": {"concurrency": 2, "per_minute": 6, "burst": 2}}; 0 or missing
+# means unlimited. Functions here are called with SERVER_STATE["lock"] held.
+
+MAX_RETRIES = 2              # Extra attempts for a job that failed with a retryable error
+RETRY_BASE_SECONDS = 5.0     # Backoff before the first retry, doubled for every further one
+RETRY_MAX_SECONDS = 120.0
+
+# Error kinds reported by the userscript that are worth another attempt
+RETRYABLE_KINDS = ("timeout", "prompt_not_found", "button_not_found", "upload_failed", "rate_limited")
+# Fallback for older userscripts: message fragments -> kind
+RETRYABLE_MESSAGES = (
+    ("timeout", "timeout"),
+    ("429", "rate_limited"),
+    ("too many requests", "rate_limited"),
+    ("rate limit", "rate_limited"),
+    ("upload", "upload_failed"),
+)
+
+class TokenBucket:
+    def __init__(self, per_minute, burst, now):
+        self.rate = per_minute / 60.0
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = now
+
+    def take(self, now):
+        # 0 if a token was taken, otherwise seconds until the next one
+        self.tokens = min(self.capacity, self.tokens + max(now - self.updated, 0) * self.rate)
+        self.updated = max(now, self.updated)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+BUCKETS = {} # site -> (per_minute, burst, TokenBucket)
+
+def admit(site, limits, running, now):
+    # Returns 0 when a job may start on site now, the seconds until a token frees up,
+    # or None when the site is at its concurrency limit (wait for a job to finish)
+    limits = limits or {}
+    concurrency = limits.get("concurrency", 0)
+    if concurrency and running >= concurrency:
+        return None
+
+    per_minute = limits.get("per_minute", 0)
+    if not per_minute:
+        BUCKETS.pop(site, None)
+        return 0
+    burst = limits.get("burst", 1)
+    entry = BUCKETS.get(site)
+    if entry is None or entry[:2] != (per_minute, burst):
+        entry = BUCKETS[site] = (per_minute, burst, TokenBucket(per_minute, burst, now))
+    return entry[2].take(now)
+
+def bucket_tokens():
+    return {site: round(entry[2].tokens, 2) for site, entry in BUCKETS.items()}
+
+def classify_error(error, kind=None):
+    # Returns the retryable kind of an error, or None if retrying would not help
+    if kind:
+        return kind if kind in RETRYABLE_KINDS else None
+    message = str(error).lower()
+    for fragment, fragment_kind in RETRYABLE_MESSAGES:
+        if fragment in message:
+            return fragment_kind
+    return None
+
+def retry_delay(attempt):
+    # Exponential backoff with jitter, so retries of a throttled site spread out
+    return min(RETRY_BASE_SECONDS * (2 ** attempt), RETRY_MAX_SECONDS) * random.uniform(0.8, 1.2)
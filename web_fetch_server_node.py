@@ -4,69 +4,808 @@ import json
 import base64
 import socket
 import os
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from io import BytesIO
+import uuid
+import hashlib
+import email.policy
+from email.parser import BytesParser
+from urllib.parse import urlsplit, parse_qs
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import torch
-import numpy as np
-from PIL import Image
+from .web_fetch_images import BATCH_MODES, SIZE_POLICIES, UPLOAD_FORMATS, encode_pixels, hash_image, pil_batch_to_tensor, split_batch, tensor_to_uint8
+from .web_fetch_cache import RESULT_CACHE_MODES, RESULTS, ByteLRU, load_result, save_result
+from .web_fetch_http import download
+from . import web_fetch_metrics as metrics
+from .web_fetch_profiles import ProfileConflict, get_limits, get_profile, list_profiles, update_profile
+from .web_fetch_scheduler import MAX_RETRIES, admit, bucket_tokens, classify_error, retry_delay
+from .web_fetch_journal import JOURNAL, JOURNAL_TTL
+from . import web_fetch_spool as spool
+from .web_fetch_spool import BudgetExceeded, Spool, close_all, spool_bytes
 
-# Global state to share between Node and Server Thread
+# ComfyUI progress bar and interrupt flag, when running inside ComfyUI
+try:
+    from comfy.utils import ProgressBar
+except ImportError:
+    ProgressBar = None
+try:
+    import comfy.model_management as model_management
+except ImportError:
+    model_management = None
+
+# Global state to share between Nodes and Server Thread
 SERVER_STATE = {
-    "job": None,          # Current job: {"id": "...", "prompt": "...", "mode": "image|text", "selectors": {...}}
-    "result": None,       # Result data: PIL Image, String, or None
-    "status": "idle",     # idle, waiting_for_browser, processsing, complete
-    "last_error": None,
-    "event": threading.Event() # Event to wake up the node
+    "jobs": {},           # job_id -> {"job": {...}, "status": "pending|claimed", "worker": ..., "site": ..., "lease_until": ..., "result": ..., "error": ..., "event": threading.Event()}
+                          # Image results hold encoded Spools, decoded when the node consumes them
+    "queue": deque(),     # Open job ids in submission order, oldest first
+    "workers": {},        # worker_id -> {"id": ..., "origin": ..., "modes": [...], "last_seen": ..., "completed": 0}
+    "lock": threading.Lock(),
+    "status": "idle",     # idle, waiting_for_browser
+    "cancelled": deque(maxlen=256), # Ids of jobs withdrawn before they finished; their tabs are told to stop
+    "retries": 0,         # Jobs re-queued after a retryable error
 }
+SERVER_STATE["queue_changed"] = threading.Condition(SERVER_STATE["lock"]) # Wakes long-polling workers and blocked submitters
 
 PORT = 9955
+LEASE_SECONDS = 30        # A claimed job goes back to the queue if its worker stops renewing
+WORKER_TTL = 90           # Workers not seen for this long are dropped from the pool
+MAX_POLL_WAIT = 30        # Upper bound for GET /job?wait=N long-polls
+MAX_CONNECTIONS = 128     # Concurrent connections served; extra ones get a 503
+MAX_REQUEST_BYTES = 64 * 1024 * 1024 # Largest accepted request body
+RESULT_BUDGET_WAIT = 10   # Seconds a result upload waits for room in the in-flight budget (web_fetch_spool) before a 503
+UPLOAD_CHUNK_BYTES = 256 * 1024 # Result bodies are read in chunks of this size
+REQUEST_TIMEOUT = 30      # Socket read timeout for stalled uploads and idle keep-alive connections
+BLOB_CACHE_BYTES = 256 * 1024 * 1024 # Encoded input images kept for GET /blob/<key>
+INTERRUPT_CHECK_SECONDS = 0.25 # How often a waiting node checks for a ComfyUI interrupt
+MAX_QUEUE_DEPTH = 256     # Pending jobs accepted before submitters have to wait
+ATTEMPT_MARGIN_SECONDS = 5 # A tab gives up this long before the node does, so its error report still arrives
+
+# Encoded input images, addressed by a hash of their pixels and upload format.
+# Jobs only carry the key; tabs download the bytes once from /blob/<key> and cache them.
+BLOBS = ByteLRU(BLOB_CACHE_BYTES)
+
+def _new_record(job, created, match_key=None):
+    return {
+        "job": job,
+        "status": "pending",
+        "worker": None,
+        "site": None,                   # Host of the tab that claimed it, for metrics
+        "lease_until": 0,
+        "result": None,
+        "error": None,
+        "partial": "",                  # Streamed text so far
+        "event": threading.Event(),     # Set once the job has a final result or error
+        "progress": threading.Event(),  # Set on every streamed update and on completion
+        "created": created,
+        "claimed": None,
+        "phases": {},                   # phase -> seconds, see web_fetch_metrics.PHASES
+        "match_key": match_key,         # Same inputs -> same key, see adopt_job()
+        "orphan": False,                # Restored from the journal, no node waiting for it
+        "attempts": 0,                  # Retries so far, see finish_job()
+        "not_before": 0,                # Retry backoff: not handed out before this time
+        "last_error": None,             # Error of the last failed attempt
+    }
+
+class QueueFull(Exception):
+    pass
+
+def submit_job(job, match_key=None, wait=0):
+    # Backpressure: with MAX_QUEUE_DEPTH jobs pending, waits up to wait seconds for room
+    job_id = uuid.uuid4().hex
+    job["id"] = job_id
+    created = time.time()
+    deadline = created + wait
+    with SERVER_STATE["queue_changed"]:
+        while _pending_count() >= MAX_QUEUE_DEPTH:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise QueueFull(f"Bridge queue is full ({MAX_QUEUE_DEPTH} pending jobs)")
+            SERVER_STATE["queue_changed"].wait(min(remaining, 1.0))
+        SERVER_STATE["jobs"][job_id] = _new_record(job, created, match_key)
+        SERVER_STATE["queue"].append(job_id)
+        SERVER_STATE["status"] = "waiting_for_browser"
+        SERVER_STATE["queue_changed"].notify_all()
+    JOURNAL.submit(job_id, match_key, job, created)
+    return job_id
+
+def _pending_count():
+    # Lock must be held
+    return sum(1 for job_id in SERVER_STATE["queue"] if SERVER_STATE["jobs"][job_id]["status"] == "pending")
+
+def adopt_job(match_key):
+    # A job restored from the journal with the same inputs, finished or still running in
+    # a tab, is taken over instead of asking the site again. Returns its id or None.
+    if match_key is None:
+        return None
+    with SERVER_STATE["lock"]:
+        for job_id, record in SERVER_STATE["jobs"].items():
+            if record["orphan"] and record["match_key"] == match_key:
+                record["orphan"] = False
+                return job_id
+    return None
+
+def next_job(include_claimed=True):
+    # Oldest job that has not been fulfilled yet
+    with SERVER_STATE["lock"]:
+        _reap_expired(time.time())
+        for job_id in SERVER_STATE["queue"]:
+            record = SERVER_STATE["jobs"][job_id]
+            if include_claimed or record["status"] == "pending":
+                return record["job"]
+        return None
+
+def finish_job(job_id, result=None, error=None, phases=None, kind=None):
+    # phases: durations measured by the browser and the request handler, in seconds.
+    # kind: error class reported by the userscript. Retryable errors put the job back
+    # in the queue after a backoff instead of failing it; returns False then.
+    with SERVER_STATE["queue_changed"]:
+        record = SERVER_STATE["jobs"].get(job_id)
+        if record is None or record["event"].is_set():
+            return False
+        if error is not None and _retry_job(job_id, record, error, kind):
+            return False
+        record["result"] = result
+        record["error"] = error
+        record["phases"].update(phases or {})
+        if record["claimed"]:
+            record["phases"]["queue"] = record["claimed"] - record["created"]
+        record["phases"]["total"] = time.time() - record["created"]
+        if job_id in SERVER_STATE["queue"]:
+            SERVER_STATE["queue"].remove(job_id)
+        worker = SERVER_STATE["workers"].get(record["worker"])
+        if worker is not None:
+            worker["completed"] += 1
+        SERVER_STATE["queue_changed"].notify_all()
+    record["event"].set()
+    record["progress"].set()
+    if record["orphan"]:
+        # Nobody waits for it until the node runs again, possibly after another restart
+        _journal_result(job_id, result, error)
+    if result is not None:
+        for phase, seconds in record["phases"].items():
+            metrics.observe(phase, record["site"], record["job"].get("mode"), seconds)
+    return True
+
+def _retry_job(job_id, record, error, kind=None):
+    # Lock must be held
+    reason = classify_error(error, kind)
+    if reason is None or record["attempts"] >= MAX_RETRIES or job_id not in SERVER_STATE["queue"]:
+        return False
+    delay = retry_delay(record["attempts"])
+    record["attempts"] += 1
+    record["last_error"] = error
+    record["status"] = "pending"
+    record["worker"] = None
+    record["partial"] = ""
+    record["not_before"] = time.time() + delay
+    SERVER_STATE["retries"] += 1
+    SERVER_STATE["queue_changed"].notify_all()
+    print(f"[WebBridge] Job {job_id} failed ({reason}), retry {record['attempts']}/{MAX_RETRIES} in {delay:.0f}s: {error}")
+    return True
+
+def _journal_result(job_id, result, error):
+    if error is not None or result is None:
+        JOURNAL.finish(job_id, error=error or "No result")
+    elif result["type"] == "text":
+        JOURNAL.finish(job_id, "text", text=result["data"])
+    else:
+        JOURNAL.finish(job_id, "image", images=[body.getvalue() for body in result["data"]])
+
+def discard_result(result):
+    # Frees the spooled image bytes of a result
+    if result is not None and result["type"] == "image":
+        close_all(result["data"])
+
+def append_partial(job_id, offset, delta):
+    # Streamed text: replaces everything from offset on, so a resent chunk is harmless.
+    # Returns False once the job is finished (e.g. the node stopped early).
+    with SERVER_STATE["lock"]:
+        record = SERVER_STATE["jobs"].get(job_id)
+        if record is None or record["event"].is_set():
+            return False
+        record["partial"] = record["partial"][:offset] + delta
+    record["progress"].set()
+    return True
+
+def release_job(job_id):
+    # Called by the owning node once it stopped waiting (result, error, timeout or
+    # interrupt). An unfinished job is withdrawn: the next lease renewal of its tab
+    # answers "cancelled", so the tab stops working on it and is free again.
+    with SERVER_STATE["queue_changed"]:
+        record = SERVER_STATE["jobs"].pop(job_id, None)
+        if job_id in SERVER_STATE["queue"]:
+            SERVER_STATE["queue"].remove(job_id)
+        if record is not None and not record["event"].is_set():
+            SERVER_STATE["cancelled"].append(job_id)
+            print(f"[WebBridge] Job {job_id} withdrawn before it finished.")
+        SERVER_STATE["queue_changed"].notify_all()
+        if not SERVER_STATE["jobs"]:
+            SERVER_STATE["status"] = "idle"
+    JOURNAL.remove(job_id)
+    return record
+
+class JobHandle:
+    # Handle on a group of submitted jobs. Keeps their records after release(), which
+    # frees every job and withdraws unfinished ones.
+    def __init__(self, job_ids):
+        self.job_ids = list(job_ids)
+        with SERVER_STATE["lock"]:
+            self.records = [SERVER_STATE["jobs"][job_id] for job_id in self.job_ids]
+
+    def release(self):
+        for job_id in self.job_ids:
+            release_job(job_id)
+
+def restore_jobs():
+    # Replays the journal at start: jobs a tab was still working on go back to that tab
+    # (it resumes them after re-registering), finished results wait for adopt_job().
+    now = time.time()
+    restored = 0
+    for entry in JOURNAL.replay():
+        if entry["error"]:
+            JOURNAL.remove(entry["id"])
+            continue
+        record = _new_record(entry["job"], entry["created"], entry["match_key"])
+        record["orphan"] = True
+        record["worker"] = entry["worker"]
+        if entry["finished"]:
+            try:
+                if entry["result_type"] == "text":
+                    record["result"] = {"type": "text", "data": entry["text"]}
+                else:
+                    record["result"] = {"type": "image", "data": [spool_bytes(data) for data in entry["images"]]}
+            except Exception as e:
+                print(f"[WebBridge] Dropping journaled job {entry['id']}: {e}")
+                JOURNAL.remove(entry["id"])
+                continue
+            record["event"].set()
+            record["progress"].set()
+        else:
+            record["status"] = "claimed"
+            record["lease_until"] = now + LEASE_SECONDS
+        with SERVER_STATE["lock"]:
+            SERVER_STATE["jobs"][entry["id"]] = record
+            if not entry["finished"]:
+                SERVER_STATE["queue"].append(entry["id"])
+                SERVER_STATE["status"] = "waiting_for_browser"
+        restored += 1
+    if restored:
+        print(f"[WebBridge] Restored {restored} job(s) from the journal.")
+
+# --- WORKER POOL ---
+# Every browser tab running the userscript registers as a worker and claims jobs
+# with a lease. Routing: a job only goes to workers that support its mode and,
+# if the job names a site, whose origin contains it. A tab runs one job at a time
+# and only asks for work while idle, so the next job goes to a free tab.
+
+def register_worker(info):
+    worker_id = info.get("id") or uuid.uuid4().hex
+    with SERVER_STATE["lock"]:
+        worker = SERVER_STATE["workers"].get(worker_id)
+        if worker is None:
+            worker = {"id": worker_id, "completed": 0}
+            SERVER_STATE["workers"][worker_id] = worker
+            print(f"[WebBridge] Worker registered: {worker_id} ({info.get('origin', '?')})")
+        worker["origin"] = info.get("origin", "")
+        worker["modes"] = info.get("modes") or ["image", "text"]
+        worker["last_seen"] = time.time()
+    return worker_id
+
+def _reap_expired(now):
+    # Lock must be held. Expired leases go back to pending, stale workers are dropped.
+    for job_id in SERVER_STATE["queue"]:
+        record = SERVER_STATE["jobs"][job_id]
+        if record["status"] == "claimed" and record["lease_until"] < now:
+            print(f"[WebBridge] Lease on job {job_id} expired (worker {record['worker']}). Re-queueing.")
+            record["status"] = "pending"
+            record["worker"] = None
+    for worker_id, worker in list(SERVER_STATE["workers"].items()):
+        if now - worker["last_seen"] > WORKER_TTL:
+            del SERVER_STATE["workers"][worker_id]
+    for job_id, record in list(SERVER_STATE["jobs"].items()):
+        if record["orphan"] and now - record["created"] > JOURNAL_TTL:
+            del SERVER_STATE["jobs"][job_id]
+            discard_result(record["result"])
+            if job_id in SERVER_STATE["queue"]:
+                SERVER_STATE["queue"].remove(job_id)
+            JOURNAL.remove(job_id)
+
+def site_of(origin):
+    # "https://gemini.google.com" -> "gemini.google.com". Keys metrics and site profiles.
+    return urlsplit(origin or "").hostname or origin or None
+
+def worker_site(worker_id):
+    with SERVER_STATE["lock"]:
+        worker = SERVER_STATE["workers"].get(worker_id)
+        return site_of(worker["origin"]) if worker else None
+
+def _worker_accepts(worker, job):
+    if job.get("mode", "image") not in worker["modes"]:
+        return False
+    site = job.get("site")
+    return not site or site in worker["origin"]
+
+def claim_job(worker_id, wait=0):
+    # Returns (job, registered). A worker first gets back a job it already holds
+    # (page reload mid-job), otherwise the oldest pending job it accepts.
+    # With wait > 0 the call blocks until a job arrives or the wait runs out.
+    deadline = time.time() + min(max(wait, 0), MAX_POLL_WAIT)
+    with SERVER_STATE["queue_changed"]:
+        while True:
+            now = time.time()
+            _reap_expired(now)
+            worker = SERVER_STATE["workers"].get(worker_id)
+            if worker is None:
+                return None, False
+            worker["last_seen"] = now
+
+            held = [SERVER_STATE["jobs"][j] for j in SERVER_STATE["queue"] if SERVER_STATE["jobs"][j]["worker"] == worker_id]
+            if held:
+                held[0]["lease_until"] = now + LEASE_SECONDS
+                held[0]["site"] = site_of(worker["origin"]) # Unknown for jobs restored from the journal
+                return _job_for_tab(held[0], now), True
+
+            site = site_of(worker["origin"])
+            wake = 5.0 # The cap makes sure expired leases are picked up too
+            for job_id in SERVER_STATE["queue"]:
+                record = SERVER_STATE["jobs"][job_id]
+                if record["status"] != "pending" or not _worker_accepts(worker, record["job"]):
+                    continue
+                if record["not_before"] > now:
+                    wake = min(wake, record["not_before"] - now) # Retry backoff
+                    continue
+                # Per-site limits (concurrency, token bucket) from the site profile
+                delay = admit(site, get_limits(site), _running_on(site), now)
+                if delay is None:
+                    break # Site busy, woken when one of its jobs finishes
+                if delay:
+                    wake = min(wake, delay)
+                    break
+                record["status"] = "claimed"
+                record["worker"] = worker_id
+                record["site"] = site
+                record["claimed"] = now
+                record["lease_until"] = now + LEASE_SECONDS
+                JOURNAL.claim(job_id, worker_id)
+                print(f"[WebBridge] Job {job_id} claimed by worker {worker_id}")
+                return _job_for_tab(record, now), True
+
+            remaining = deadline - now
+            if remaining <= 0:
+                return None, True
+            # Woken by submit_job, finish_job and release_job
+            SERVER_STATE["queue_changed"].wait(min(remaining, wake))
+
+def attempt_deadline(record):
+    # When the node stops waiting for the current attempt. Every retry gets the full timeout again.
+    return max(record["created"], record["not_before"]) + record["job"].get("timeout", 0)
+
+def _job_for_tab(record, now):
+    # The job as sent to a tab: its timeout is what is left of the attempt, so a tab
+    # that times out still reaches a waiting node and the job can be retried
+    if record["orphan"]:
+        return record["job"] # Nobody waits for it, the tab gets the full timeout
+    left = attempt_deadline(record) - now - ATTEMPT_MARGIN_SECONDS
+    return dict(record["job"], timeout=max(round(left, 1), 1))
+
+def _running_on(site):
+    # Lock must be held
+    return sum(1 for job_id in SERVER_STATE["queue"]
+               if SERVER_STATE["jobs"][job_id]["status"] == "claimed" and SERVER_STATE["jobs"][job_id]["site"] == site)
+
+def queue_report():
+    # Queue depth and wait times for /status, /stats and /metrics
+    now = time.time()
+    with SERVER_STATE["lock"]:
+        records = [SERVER_STATE["jobs"][job_id] for job_id in SERVER_STATE["queue"]]
+        pending = [record for record in records if record["status"] == "pending"]
+        sites = {}
+        for record in records:
+            if record["status"] == "claimed":
+                sites.setdefault(record["site"], {"running": 0})["running"] += 1
+        for site, tokens in bucket_tokens().items():
+            sites.setdefault(site, {"running": 0})["tokens"] = tokens
+        return {
+            "queue_depth": len(pending),
+            "max_queue_depth": MAX_QUEUE_DEPTH,
+            "running": len(records) - len(pending),
+            "retrying": sum(1 for record in pending if record["not_before"] > now),
+            "oldest_wait": round(max((now - record["created"] for record in pending), default=0), 3),
+            "retries": SERVER_STATE["retries"],
+            "sites": sites,
+        }
+
+def renew_lease(job_id, worker_id):
+    now = time.time()
+    with SERVER_STATE["lock"]:
+        worker = SERVER_STATE["workers"].get(worker_id)
+        if worker is not None:
+            worker["last_seen"] = now
+        record = SERVER_STATE["jobs"].get(job_id)
+        if record is None or record["worker"] != worker_id or job_id not in SERVER_STATE["queue"]:
+            return False
+        record["lease_until"] = now + LEASE_SECONDS
+        return True
+
+def list_workers():
+    with SERVER_STATE["lock"]:
+        _reap_expired(time.time())
+        busy = {}
+        for job_id in SERVER_STATE["queue"]:
+            worker_id = SERVER_STATE["jobs"][job_id]["worker"]
+            if worker_id:
+                busy[worker_id] = busy.get(worker_id, 0) + 1
+        return [dict(w, active=busy.get(w["id"], 0)) for w in SERVER_STATE["workers"].values()]
+
+# --- INPUT BLOBS ---
+
+def store_input_blob(img_tensor, upload_format="PNG (fast)", quality=90):
+    # Returns the blob key. Identical inputs are encoded only once.
+    pixels = tensor_to_uint8(img_tensor)
+    key = hashlib.sha256(pixels.tobytes() + f"{pixels.shape}|{upload_format}|{quality}".encode('utf-8')).hexdigest()
+    if BLOBS.get(key) is None:
+        img_bytes, mime = encode_pixels(pixels, upload_format, quality)
+        BLOBS.put(key, (img_bytes, mime), len(img_bytes), keep=_open_blob_keys())
+        print(f"[WebBridge] Encoded input image {key[:12]} ({mime}, {len(img_bytes)} bytes).")
+    else:
+        print(f"[WebBridge] Reusing cached input image {key[:12]}.")
+    return key
+
+def _open_blob_keys():
+    # Blobs still referenced by queued jobs must stay downloadable
+    with SERVER_STATE["lock"]:
+        return {record["job"].get("input_blob") for record in SERVER_STATE["jobs"].values()}
+
+def _find_all(fp, needle, chunk_size):
+    # Offsets of needle in a file, read in chunks
+    offsets = []
+    fp.seek(0)
+    pos = 0 # File offset of buff[0]
+    buff = b""
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return offsets
+        buff += chunk
+        i = buff.find(needle)
+        while i != -1:
+            offsets.append(pos + i)
+            i = buff.find(needle, i + len(needle))
+        drop = max(len(buff) - len(needle) + 1, 0) # Keep a tail that may start the next match
+        pos += drop
+        buff = buff[drop:]
+
+def split_multipart_images(body, content_type_header):
+    # multipart/form-data result with one part per image, in page order. The parts are
+    # located in the spooled body and copied into a Spool each, chunk by chunk, taking over
+    # the body's budget; only headers are parsed in memory and decoding waits for the node.
+    # Parts are expected as raw bytes, as browsers send FormData.
+    parser = BytesParser(policy=email.policy.default)
+    boundary = parser.parsebytes(b"Content-Type: " + content_type_header.encode('latin-1') + b"\r\n\r\n").get_boundary()
+    if not boundary:
+        raise Exception("Multipart result has no boundary")
+    delimiter = b"\r\n--" + boundary.encode('latin-1')
+
+    offsets = _find_all(body, delimiter, UPLOAD_CHUNK_BYTES)
+    body.seek(0)
+    if body.read(len(delimiter) - 2) == delimiter[2:]:
+        offsets.insert(0, -2) # First delimiter has no CRLF in front
+    images = []
+    try:
+        for start, end in zip(offsets, offsets[1:]):
+            body.seek(start + len(delimiter))
+            head = body.read(min(end - start - len(delimiter), 16 * 1024))
+            line_end = head.find(b"\r\n")
+            headers_end = head.find(b"\r\n\r\n", line_end)
+            if line_end == -1 or headers_end == -1:
+                raise Exception("Malformed multipart result")
+            headers = parser.parsebytes(head[line_end + 2:headers_end + 4], headersonly=True)
+            if not headers.get_content_type().startswith('image/'):
+                continue
+
+            data_start = start + len(delimiter) + headers_end + 4
+            image = Spool()
+            images.append(image)
+            body.hand_over(image, end - data_start)
+            body.seek(data_start)
+            remaining = end - data_start
+            while remaining > 0:
+                chunk = body.read(min(remaining, UPLOAD_CHUNK_BYTES))
+                if not chunk:
+                    raise Exception("Malformed multipart result")
+                image.write(chunk)
+                remaining -= len(chunk)
+            image.probe()
+    except Exception:
+        close_all(images)
+        raise
+    if not images:
+        raise Exception("Multipart result contains no image parts")
+    return images
+
+def download_images(items):
+    # Direct download of result images into Spools. All or nothing.
+    images = []
+    try:
+        for item in items:
+            if urlsplit(item["url"]).scheme not in ("http", "https"):
+                raise Exception(f"Refusing to download {item['url']}: only http(s) URLs are fetched")
+            images.append(Spool())
+            download(item["url"], headers=item.get("headers"), max_bytes=MAX_REQUEST_BYTES, out=images[-1])
+            images[-1].probe()
+    except Exception:
+        close_all(images)
+        raise
+    return images
+
+class RequestTooLarge(Exception):
+    pass
 
 class RequestHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, code=200, content_type='application/json'):
+    protocol_version = 'HTTP/1.1' # Keep-alive between polls and uploads
+    timeout = REQUEST_TIMEOUT
+
+    def _set_headers(self, code=200, content_type='application/json', content_length=0):
         self.send_response(code)
         self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(content_length))
         self.send_header('Access-Control-Allow-Origin', '*') # Allow any browser
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-WebBridge-Timings')
         self.end_headers()
 
+    def _send_json(self, payload, code=200):
+        body = json.dumps(payload).encode('utf-8')
+        self._set_headers(code, content_length=len(body))
+        self.wfile.write(body)
+
+    def _send_blob(self, key):
+        blob = BLOBS.get(key)
+        if blob is None:
+            self._send_json({"error": f"Unknown blob: {key}"}, 404)
+            return
+        etag = f'"{key}"'
+        # Blobs are immutable, so browsers may cache them for good
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        img_bytes, mime = blob
+        self.send_response(200)
+        self.send_header('Content-type', mime)
+        self.send_header('Content-Length', str(len(img_bytes)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(img_bytes)
+
+    def _content_length(self):
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length > MAX_REQUEST_BYTES:
+            self.close_connection = True # Body is left unread
+            raise RequestTooLarge(f"Request body of {content_length} bytes exceeds the {MAX_REQUEST_BYTES} byte limit")
+        return content_length
+
+    def _read_body(self):
+        return self.rfile.read(self._content_length())
+
+    def _read_result_body(self):
+        # Streams a result body into a Spool, after waiting for room in the in-flight budget
+        content_length = self._content_length()
+        body = Spool(RESULT_BUDGET_WAIT)
+        try:
+            try:
+                body.reserve(content_length)
+            except BudgetExceeded:
+                self.close_connection = True # Body is left unread
+                raise
+            remaining = content_length
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, UPLOAD_CHUNK_BYTES))
+                if not chunk:
+                    raise Exception("Connection closed during upload")
+                body.write(chunk)
+                remaining -= len(chunk)
+        except Exception:
+            body.close()
+            raise
+        body.seek(0)
+        return body
+
+    def _browser_timings(self):
+        # Phase durations the userscript measured, sent as {"phase": milliseconds}
+        try:
+            timings = json.loads(self.headers.get('X-WebBridge-Timings') or '{}')
+            return {phase: float(ms) / 1000.0 for phase, ms in timings.items() if phase in metrics.PHASES}
+        except (ValueError, TypeError, AttributeError):
+            return {}
+
+    def _read_json(self):
+        body = self._read_body()
+        if not body:
+            return {}
+        return json.loads(body.decode('utf-8'))
+
     def do_OPTIONS(self):
         self._set_headers()
 
     def do_GET(self):
-        if self.path == '/job':
-            self._set_headers()
-            response = {"job": SERVER_STATE["job"]}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
-        elif self.path == '/status':
-             self._set_headers()
-             self.wfile.write(json.dumps({"status": SERVER_STATE["status"]}).encode('utf-8'))
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/job':
+            worker_id = query.get('worker', [None])[0]
+            if worker_id:
+                try:
+                    wait = float(query.get('wait', ['0'])[0])
+                except ValueError:
+                    wait = 0
+                job, registered = claim_job(worker_id, wait)
+                response = {"job": job, "registered": registered}
+                if job:
+                    # Latest selector profile for the tab's site, so edits reach running tabs
+                    response["profile"] = get_profile(worker_site(worker_id))
+                self._send_json(response)
+            else:
+                # Legacy userscripts without a worker id: peek at the oldest unclaimed job
+                self._send_json({"job": next_job(include_claimed=False)})
+        elif url.path.startswith('/blob/'):
+            self._send_blob(url.path[len('/blob/'):])
+        elif url.path == '/workers':
+            self._send_json({"workers": list_workers()})
+        elif url.path == '/profiles':
+            self._send_json({"profiles": list_profiles()})
+        elif url.path.startswith('/profiles/'):
+            site = url.path[len('/profiles/'):]
+            profile = get_profile(site)
+            if profile is None:
+                self._send_json({"error": f"No profile for {site}"}, 404)
+            else:
+                self._send_json({"profile": profile})
+        elif url.path == '/status':
+            self._send_json(dict({
+                "status": SERVER_STATE["status"],
+                "pending": len(SERVER_STATE["queue"]),
+                "workers": len(SERVER_STATE["workers"]),
+            }, **queue_report()))
+        elif url.path == '/stats':
+            self._send_json({
+                "phases": metrics.stats(),
+                "queue": queue_report(),
+                "pending": len(SERVER_STATE["queue"]),
+                "workers": len(SERVER_STATE["workers"]),
+                "blob_cache": BLOBS.stats(),
+                "result_cache": RESULTS.stats(),
+                "results_in_flight": spool.stats(),
+            })
+        elif url.path == '/metrics':
+            queue = queue_report()
+            in_flight = spool.stats()
+            body = metrics.render_prometheus({
+                "webbridge_queue_depth": ("Jobs waiting for a tab.", queue["queue_depth"]),
+                "webbridge_jobs_running": ("Jobs a tab is working on.", queue["running"]),
+                "webbridge_oldest_wait_seconds": ("Age of the oldest waiting job.", queue["oldest_wait"]),
+                "webbridge_job_retries": ("Jobs re-queued after a retryable error since start.", queue["retries"]),
+                "webbridge_jobs_open": ("Jobs posted and not yet fulfilled.", len(SERVER_STATE["queue"])),
+                "webbridge_workers": ("Registered browser tabs.", len(SERVER_STATE["workers"])),
+                "webbridge_blob_cache_bytes": ("Bytes held by the input image cache.", BLOBS.stats()["bytes"]),
+                "webbridge_result_cache_bytes": ("Bytes held by the in-memory result cache.", RESULTS.stats()["bytes"]),
+                "webbridge_results_in_flight_bytes": ("Result bytes received and not yet consumed by a node.", in_flight["bytes"]),
+                "webbridge_results_in_flight_limit_bytes": ("Budget for result bytes in flight.", in_flight["limit"]),
+                "webbridge_results_in_flight_disk_bytes": ("Result bytes in flight spilled to temp files.", in_flight["disk_bytes"]),
+                "webbridge_results_rejected": ("Result uploads deferred because the budget was full, since start.", in_flight["rejected"]),
+            }).encode('utf-8')
+            self._set_headers(200, 'text/plain; version=0.0.4', len(body))
+            self.wfile.write(body)
         else:
             self._set_headers(404)
 
     def do_POST(self):
-        if self.path == '/result':
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/workers':
+            try:
+                worker_id = register_worker(self._read_json())
+                self._send_json({"worker_id": worker_id, "profile": get_profile(worker_site(worker_id))})
+            except Exception as e:
+                self._send_json({"error": str(e)}, 400)
+            return
+
+        # /profiles/<site> changes a site profile: {"selectors": {...}, "limits": {...}, "version": n}
+        if url.path.startswith('/profiles/'):
             try:
-                content_length = int(self.headers.get('Content-Length', 0))
-                print(f"[WebBridge] Receiving POST /result. Size: {content_length} bytes")
+                data = self._read_json()
+                profile = update_profile(url.path[len('/profiles/'):], data.get("selectors") or {}, data.get("version"), data.get("limits"))
+                self._send_json({"profile": profile})
+            except ProfileConflict as e:
+                self._send_json({"error": str(e), "profile": e.profile}, 409)
+            except Exception as e:
+                self._send_json({"error": str(e)}, 400)
+            return
+
+        if url.path.startswith('/lease/'):
+            job_id = url.path[len('/lease/'):]
+            if renew_lease(job_id, query.get('worker', [None])[0]):
+                self._send_json({"status": "renewed", "lease_seconds": LEASE_SECONDS})
+            elif job_id in SERVER_STATE["cancelled"]:
+                self._send_json({"status": "cancelled"}, 410)
+            else:
+                self._send_json({"error": f"Job {job_id} is not leased by this worker"}, 409)
+            return
+
+        # /result/<job_id>/partial streams text while it is being generated
+        if url.path.startswith('/result/') and url.path.endswith('/partial'):
+            job_id = url.path[len('/result/'):-len('/partial')]
+            try:
+                data = self._read_json()
+                accepted = append_partial(job_id, int(data.get("offset", 0)), str(data.get("delta", "")))
+                self._send_json({"status": "received" if accepted else "closed"})
+            except Exception as e:
+                self._send_json({"error": str(e)}, 400)
+            return
+
+        # /result/<job_id> fulfils exactly that job. Bare /result (older userscripts)
+        # fulfils the oldest open job.
+        if url.path == '/result' or url.path.startswith('/result/'):
+            job_id = url.path[len('/result/'):] if url.path.startswith('/result/') else None
+            if not job_id:
+                job = next_job()
+                job_id = job["id"] if job else None
+
+            if job_id is None or job_id not in SERVER_STATE["jobs"]:
+                self.close_connection = True # Body is left unread
+                self._send_json({"error": f"Unknown job: {job_id}"}, 404)
+                return
+
+            body = None
+            try:
+                content_type = self.headers.get('Content-Type', 'application/json').split(';')[0].strip().lower()
+                started = time.time()
+                body = self._read_result_body()
+                received = time.time()
+                phases = self._browser_timings()
+                phases["upload"] = received - started
+
+                def done(**kwargs):
+                    phases["decode"] = time.time() - received
+                    if not finish_job(job_id, phases=phases, **kwargs):
+                        discard_result(kwargs.get("result")) # Job was withdrawn or already answered
+                print(f"[WebBridge] Receiving POST /result for job {job_id}. Size: {body.size} bytes ({content_type})")
                 
-                if content_length == 0:
+                if not body.size:
                      raise Exception("Empty request body")
 
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
+                if content_type.startswith('image/'):
+                    # Binary upload: the spooled body is the result, decoded once the node needs it
+                    width, height = body.probe()
+                    image, body = body, None
+                    done(result={"type": "image", "data": [image]})
+                    print(f"[WebBridge] Image received ({width}x{height}).")
+                    self._send_json({"status": "received"})
+                    return
+
+                if content_type == 'multipart/form-data':
+                    # Several result images of one job
+                    images = split_multipart_images(body, self.headers.get('Content-Type'))
+                    done(result={"type": "image", "data": images})
+                    print(f"[WebBridge] {len(images)} images received.")
+                    self._send_json({"status": "received"})
+                    return
+
+                data = json.load(body)
                 
                 if "error" in data:
                      print(f"[WebBridge] Client reported error: {data['error']}")
-                     SERVER_STATE["last_error"] = data["error"]
-                     SERVER_STATE["result"] = None
+                     done(error=data["error"], kind=data.get("kind"))
                 
                 elif "text" in data:
                     print(f"[WebBridge] Received text data. Length: {len(data['text'])}")
-                    SERVER_STATE["result"] = {"type": "text", "data": data["text"]}
+                    done(result={"type": "text", "data": data["text"]})
 
                 elif "image" in data:
-                    b64_str = data["image"]
+                    b64_str = data.pop("image")
                     print(f"[WebBridge] Received image data. Length: {len(b64_str)}")
                     
                     if "," in b64_str:
@@ -74,43 +813,99 @@ class RequestHandler(BaseHTTPRequestHandler):
                     else:
                         encoded = b64_str
 
-                    img_data = base64.b64decode(encoded)
-                    img = Image.open(BytesIO(img_data))
-                    
-                    # Force verify image
-                    img.verify() 
-                    img = Image.open(BytesIO(img_data)) # Re-open after verify
-                    
-                    SERVER_STATE["result"] = {"type": "image", "data": img}
-                    print("[WebBridge] Image decoded successfully.")
+                    image = spool_bytes(base64.b64decode(encoded))
+                    try:
+                        image.probe()
+                    except Exception:
+                        image.close()
+                        raise
+                    done(result={"type": "image", "data": [image]})
+                    print("[WebBridge] Image received.")
+
+                elif "urls" in data:
+                    # Direct download: the browser only sends the image URLs (plus the headers it
+                    # would use), so the bytes skip the browser -> bridge relay entirely.
+                    # Only for jobs the node posted with Direct Download: the bridge is reachable
+                    # without authentication and must not fetch arbitrary URLs for any client.
+                    record = SERVER_STATE["jobs"].get(job_id)
+                    if record is None or record["job"].get("fetch") != "server":
+                        self._send_json({"error": f"Job {job_id} does not use direct download"}, 403)
+                        return
+                    print(f"[WebBridge] Downloading {len(data['urls'])} result image(s) directly.")
+                    try:
+                        images = download_images(data["urls"])
+                    except Exception as e:
+                        # Job stays open; the browser falls back to relaying the image bytes itself
+                        print(f"[WebBridge] Direct download failed, asking browser to relay: {e}")
+                        self._send_json({"status": "relay", "error": str(e)}, 502)
+                        return
+                    done(result={"type": "image", "data": images})
+
+                else:
+                    raise Exception("Result body has no 'image', 'urls', 'text' or 'error' field")
                 
-                SERVER_STATE["event"].set()
-                self._set_headers()
-                self.wfile.write(json.dumps({"status": "received"}).encode('utf-8'))
+                self._send_json({"status": "received"})
+
+            except BudgetExceeded as e:
+                # Job stays open; the browser retries the upload once nodes consumed earlier results
+                print(f"[WebBridge] Deferring result for job {job_id}: {e}")
+                self._send_json({"status": "busy", "error": str(e)}, 503)
                 
             except Exception as e:
                 print(f"[WebBridge] Error processing POST: {e}")
-                SERVER_STATE["last_error"] = str(e)
-                # Still set event to wake up node and show error
-                SERVER_STATE["event"].set() 
+                # Still finish the job to wake up the node and show error
+                finish_job(job_id, error=str(e))
                 
-                self._set_headers(400)
-                self.wfile.write(json.dumps({"error": str(e)}).encode('utf-8'))
+                self._send_json({"error": str(e)}, 413 if isinstance(e, RequestTooLarge) else 400)
+            finally:
+                if body is not None:
+                    body.close()
         else:
+            self.close_connection = True # Body is left unread
             self._set_headers(404)
 
     def log_message(self, format, *args):
         return # Silence server logs
 
+class BridgeHTTPServer(ThreadingHTTPServer):
+    # One thread per connection so long-polling workers and large uploads don't block
+    # each other, bounded so a flood of connections can't spawn unlimited threads.
+    request_queue_size = 64
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            try:
+                request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.slots.release()
+
 def start_server():
     try:
-        server = HTTPServer(('0.0.0.0', PORT), RequestHandler)
+        server = BridgeHTTPServer(('0.0.0.0', PORT), RequestHandler)
         print(f"WebFetch Server started on port {PORT}")
         server.serve_forever()
     except Exception as e:
         print(f"Failed to start server (might be already running): {e}")
 
 # Start server in background thread on module import
+restore_jobs()
 server_thread = threading.Thread(target=start_server, daemon=True)
 server_thread.start()
 
@@ -127,6 +922,19 @@ class WebFetchServerNode:
                 "input_image": ("IMAGE",),
                 "timeout": ("INT", {"default": 60, "min": 5, "max": 600}),
                 "selector_override_json": ("STRING", {"default": "{}", "multiline": True}),
+                "target_site": ("STRING", {"default": "", "multiline": False}),
+                "batch_mode": (BATCH_MODES,),
+                "size_policy": (SIZE_POLICIES,),
+                "result_images": (["First", "All"],),
+                "settle_seconds": ("FLOAT", {"default": 2.0, "min": 0.1, "max": 60.0, "step": 0.1}), # Quiet time that marks a result as finished
+                "stop_sequence": ("STRING", {"default": "", "multiline": False}), # Text mode: return as soon as this appears
+                "max_chars": ("INT", {"default": 0, "min": 0, "max": 1000000}), # Text mode: return once this many characters streamed, 0 = no limit
+                "upload_format": (UPLOAD_FORMATS,),
+                "upload_quality": ("INT", {"default": 90, "min": 1, "max": 100}),
+                "result_transfer": (["Browser Relay", "Direct Download"],), # Direct: the bridge downloads result URLs itself
+                "result_cache": (RESULT_CACHE_MODES,),
+                "cache_ttl": ("INT", {"default": 0, "min": 0, "max": 31536000}), # Seconds, 0 = never expires
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}), # Change to force a fresh result
             }
         }
 
@@ -135,13 +943,46 @@ class WebFetchServerNode:
     FUNCTION = "process"
     CATEGORY = "WebFetch"
 
-    def process(self, mode, prompt, input_image=None, timeout=60, selector_override_json="{}"):
-        # 1. Reset State
-        SERVER_STATE["event"].clear()
-        SERVER_STATE["result"] = None
-        SERVER_STATE["last_error"] = None
-        
-        # 2. Build Selectors from JSON Override
+    # Inputs that change what the browser produces, and so make up the result cache key
+    CACHE_KEY_INPUTS = ("mode", "prompt", "selector_override_json", "target_site", "batch_mode", "size_policy",
+                        "result_images", "upload_format", "upload_quality", "seed", "stop_sequence", "max_chars")
+
+    @classmethod
+    def IS_CHANGED(s, result_cache="Off", cache_ttl=0, **kwargs):
+        # Linked inputs such as input_image are not passed here; ComfyUI tracks those itself.
+        # With a TTL the value changes once per period, so expired entries get refreshed.
+        if result_cache == "Off":
+            return ""
+        period = int(time.time() // cache_ttl) if cache_ttl else 0
+        return f"{s.cache_key(kwargs)}:{period}"
+
+    @classmethod
+    def cache_key(s, params, input_image=None):
+        key = json.dumps({name: params.get(name) for name in s.CACHE_KEY_INPUTS}, sort_keys=True)
+        if input_image is not None:
+            key += hash_image(input_image)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def process(self, mode, prompt, input_image=None, timeout=60, selector_override_json="{}", target_site="",
+                batch_mode="Single", size_policy="Resize to First", result_images="First",
+                upload_format="PNG (fast)", upload_quality=90, result_cache="Off", cache_ttl=0, seed=0, settle_seconds=2.0,
+                stop_sequence="", max_chars=0, result_transfer="Browser Relay"):
+        # 0. Result Cache
+        cache_key = None
+        if result_cache != "Off":
+            cache_key = self.cache_key({
+                "mode": mode, "prompt": prompt, "selector_override_json": selector_override_json,
+                "target_site": target_site, "batch_mode": batch_mode, "size_policy": size_policy,
+                "result_images": result_images, "upload_format": upload_format,
+                "upload_quality": upload_quality, "seed": seed,
+                "stop_sequence": stop_sequence, "max_chars": max_chars,
+            }, input_image)
+            cached = load_result(cache_key, cache_ttl, use_disk=(result_cache == "Memory + Disk"))
+            if cached is not None:
+                print(f"[WebBridge] Returning cached result {cache_key[:12]}.")
+                return cached
+
+        # 1. Build Selectors from JSON Override
         selectors = {}
         try:
              overrides = json.loads(selector_override_json)
@@ -150,70 +991,135 @@ class WebFetchServerNode:
         except:
              pass
         
-        # 3. Prepare Image Payload
-        input_image_b64 = None
-        if input_image is not None:
-            try:
-                # input_image is [B, H, W, C]
-                img_tensor = input_image[0]
-                i = 255. * img_tensor.cpu().numpy()
-                img_pil = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-                
-                buff = BytesIO()
-                img_pil.save(buff, format="PNG")
-                input_image_b64 = "data:image/png;base64," + base64.b64encode(buff.getvalue()).decode('utf-8')
-                print("[WebBridge] Processed input image for upload.")
-            except Exception as e:
-                print(f"[WebBridge] Error processing input image: {e}")
-
-        # 4. Post Job
-        SERVER_STATE["job"] = {
-            "id": str(time.time()),
-            "mode": mode.lower(),
-            "prompt": prompt,
-            "timeout": timeout,
-            "selectors": selectors,
-            "input_image": input_image_b64
-        }
-        SERVER_STATE["status"] = "waiting_for_browser"
+        # 2. Post one Job per batch element. All jobs are queued at once so idle tabs run them in parallel.
+        job_ids = []
+        for item_prompt, img_tensor in split_batch(prompt, input_image, batch_mode):
+            job = {
+                "mode": mode.lower(),
+                "prompt": item_prompt,
+                "timeout": timeout,
+                "selectors": selectors,
+                "input_blob": self.upload_input_image(img_tensor, upload_format, upload_quality),
+                "site": target_site.strip() or None,
+                "collect": result_images.lower(),
+                "settle": settle_seconds,
+                "fetch": "server" if result_transfer == "Direct Download" else "browser",
+            }
+            # A job with the same inputs that survived a ComfyUI restart is picked up instead
+            match_key = hashlib.sha256(f"{json.dumps(job, sort_keys=True)}|{seed}".encode('utf-8')).hexdigest()
+            job_id = adopt_job(match_key)
+            if job_id is not None:
+                print(f"[WebBridge] Picking up job {job_id} from before the restart.")
+            else:
+                try:
+                    job_id = submit_job(job, match_key, wait=timeout)
+                except QueueFull:
+                    for posted in job_ids:
+                        record = release_job(posted)
+                        if record is not None:
+                            discard_result(record["result"]) # e.g. an adopted journal result
+                    raise
+            job_ids.append(job_id)
         
-        print(f"Job posted ({mode}). Waiting for browser to fetch from http://localhost:{PORT}...")
+        print(f"{len(job_ids)} job(s) posted ({mode}). Waiting for browser to fetch from http://localhost:{PORT}...")
         
-        # 5. Wait
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if SERVER_STATE["event"].is_set():
-                break
-            time.sleep(0.5)
+        # 3. Wait for all jobs under one shared deadline. On a timeout, an error or a ComfyUI
+        # interrupt the remaining jobs are withdrawn right away, freeing their tabs. Spooled
+        # results are freed on every way out, interrupts included.
+        handle = JobHandle(job_ids)
+        records = handle.records
+        deadline = time.time() + timeout
+        pbar = ProgressBar(len(job_ids)) if ProgressBar is not None else None
+        try:
+            try:
+                for i, (job_id, record) in enumerate(zip(handle.job_ids, records)):
+                    self.wait_for_job(job_id, record, deadline, stop_sequence, max_chars)
+                    if record["error"] or not record["event"].is_set():
+                        break
+                    if pbar is not None:
+                        pbar.update_absolute(i + 1)
+            finally:
+                handle.release()
+            return self.collect_results(records, mode, size_policy, cache_key, result_cache)
+        finally:
+            for record in records:
+                discard_result(record["result"])
+
+    def collect_results(self, records, mode, size_policy, cache_key=None, result_cache="Off"):
+        # 4. Process Results
+        for record in records:
+            if record["error"]:
+                 raise Exception(f"Browser reported error: {record['error']}")
+                 
+            if record["result"] is None and record["last_error"]:
+                raise Exception(f"Browser reported error after {record['attempts']} retries: {record['last_error']}")
+
+            if record["result"] is None:
+                raise Exception("Timeout: Browser did not send a result in time. Make sure the Userscript is running.")
             
-        # 6. Process Result
-        SERVER_STATE["job"] = None # Clear job
-        SERVER_STATE["status"] = "idle"
-        
-        if SERVER_STATE["last_error"]:
-             raise Exception(f"Browser reported error: {SERVER_STATE['last_error']}")
-             
-        if SERVER_STATE["result"] is None:
-            raise Exception("Timeout: Browser did not send a result in time. Make sure the Userscript is running.")
+        # 5. Return based on Type
+        started = time.time()
+        images = []
+        texts = []
+        for record in records:
+            res_type = record["result"].get("type")
+            res_data = record["result"].get("data")
             
-        # 7. Return based on Type
-        res_type = SERVER_STATE["result"].get("type")
-        res_data = SERVER_STATE["result"].get("data")
+            if res_type == "image":
+                # One job may return several images. Decoded only now, and each spool is freed right after.
+                for body in res_data:
+                    images.append(body.decode())
+                    body.close()
+                
+            elif res_type == "text":
+                texts.append(str(res_data))
+                
+            else:
+                print(f"Unknown result type: {res_type}")
         
         # Default empty returns
-        empty_img = torch.zeros((1, 64, 64, 3), dtype=torch.float32, device="cpu")
-        empty_text = ""
-        
-        if res_type == "image":
-             # Convert PIL to Tensor
-            img = res_data.convert("RGB")
-            img = np.array(img).astype(np.float32) / 255.0
-            img = torch.from_numpy(img)[None,]
-            return (img, empty_text)
-            
-        elif res_type == "text":
-            return (empty_img, str(res_data))
-            
+        if images:
+            out_img = pil_batch_to_tensor(images, size_policy)
+            metrics.observe("tensor", records[0]["site"], mode.lower(), time.time() - started)
         else:
-            print(f"Unknown result type: {res_type}")
-            return (empty_img, empty_text)
+            out_img = torch.zeros((1, 64, 64, 3), dtype=torch.float32, device="cpu")
+        outputs = (out_img, "\n\n".join(texts))
+        
+        if cache_key is not None:
+            save_result(cache_key, outputs, use_disk=(result_cache == "Memory + Disk"))
+        return outputs
+
+    def upload_input_image(self, img_tensor, upload_format="PNG (fast)", upload_quality=90):
+        # img_tensor is a single [H, W, C] image. Returns its blob key.
+        if img_tensor is None:
+            return None
+        try:
+            return store_input_blob(img_tensor, upload_format, upload_quality)
+        except Exception as e:
+            print(f"[WebBridge] Error processing input image: {e}")
+            return None
+
+    def wait_for_job(self, job_id, record, deadline, stop_sequence="", max_chars=0):
+        # Blocks until the job is finished. Streamed text (only what the page showed after
+        # Generate, see the userscript's freshText) is checked on every update, and the job
+        # is finished early once the stop sequence or max_chars is reached.
+        # Raises ComfyUI's interrupt exception when the user cancels the prompt.
+        while not record["event"].is_set():
+            # A retried job gets a new deadline of its own
+            remaining = max(deadline, attempt_deadline(record)) - time.time()
+            if remaining <= 0:
+                return
+            record["progress"].wait(min(remaining, INTERRUPT_CHECK_SECONDS))
+            record["progress"].clear()
+            if model_management is not None:
+                model_management.throw_exception_if_processing_interrupted()
+
+            text = record["partial"]
+            if stop_sequence and stop_sequence in text:
+                text = text[:text.index(stop_sequence)]
+            elif max_chars and len(text) >= max_chars:
+                text = text[:max_chars]
+            else:
+                continue
+            if finish_job(job_id, result={"type": "text", "data": text}):
+                print(f"[WebBridge] Job {job_id} stopped early after {len(text)} streamed characters.")
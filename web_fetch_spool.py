@@ -0,0 +1,128 @@
+import tempfile
+import threading
+from PIL import Image
+
+# Result bytes on their way from the browser to the node. Bodies are streamed into a
+# Spool instead of one bytes object: small ones stay in memory, larger ones move to an
+# anonymous temp file. Images are only decoded when the owning node consumes them, so a
+# result waiting in SERVER_STATE costs its encoded size and no RAM once spilled.
+# Every open Spool counts against MAX_INFLIGHT_BYTES until it is closed.
+
+MAX_INFLIGHT_BYTES = 1024 * 1024 * 1024 # Result bytes received and not yet consumed, memory and disk
+SPOOL_MEMORY_BYTES = 1024 * 1024        # A Spool larger than this is moved to a temp file
+
+STATE = {
+    "bytes": 0,       # Reserved by open spools
+    "peak": 0,
+    "rejected": 0,    # Reservations refused because the budget stayed full
+    "spools": set(),  # Open spools
+}
+STATE_CHANGED = threading.Condition()
+
+class BudgetExceeded(Exception):
+    pass
+
+def _acquire(size, wait=0):
+    # Waits up to wait seconds for size bytes of room in the in-flight budget
+    with STATE_CHANGED:
+        if not STATE_CHANGED.wait_for(lambda: STATE["bytes"] + size <= MAX_INFLIGHT_BYTES, wait):
+            STATE["rejected"] += 1
+            raise BudgetExceeded(f"Result budget is full ({STATE['bytes']} of {MAX_INFLIGHT_BYTES} bytes in flight)")
+        STATE["bytes"] += size
+        STATE["peak"] = max(STATE["peak"], STATE["bytes"])
+
+def _release(size):
+    with STATE_CHANGED:
+        STATE["bytes"] -= size
+        STATE_CHANGED.notify_all()
+
+class Spool:
+    def __init__(self, wait=0):
+        # wait: seconds a write may wait for room in the budget
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES, prefix="webbridge-")
+        self.wait = wait
+        self.size = 0
+        self.reserved = 0
+        self.closed = False
+        with STATE_CHANGED:
+            STATE["spools"].add(self)
+
+    def reserve(self, size):
+        # Claims room for a body of known size up front, before any of it is read
+        if size > self.reserved:
+            _acquire(size - self.reserved, self.wait)
+            self.reserved = size
+
+    def write(self, data):
+        if self.size + len(data) > self.reserved:
+            self.reserve(self.size + len(data))
+        self.file.write(data)
+        self.size += len(data)
+
+    def hand_over(self, other, size):
+        # Moves size bytes of this spool's reservation to other, e.g. when the body is
+        # split into parts and closed afterwards, so the bytes never count twice
+        size = min(size, self.reserved)
+        self.reserved -= size
+        other.reserved += size
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    @property
+    def spilled(self):
+        return self.size > SPOOL_MEMORY_BYTES
+
+    def getvalue(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def probe(self):
+        # Reads only the image header: rejects non-images without decoding any pixels
+        self.file.seek(0)
+        return Image.open(self.file).size
+
+    def decode(self):
+        # Single decode pass. load() raises on truncated or corrupt data.
+        self.file.seek(0)
+        img = Image.open(self.file)
+        img.load()
+        return img
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.file.close()
+        with STATE_CHANGED:
+            STATE["spools"].discard(self)
+        _release(self.reserved)
+
+def spool_bytes(data, wait=0):
+    spool = Spool(wait)
+    try:
+        spool.write(data)
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+def close_all(spools):
+    for spool in spools:
+        spool.close()
+
+def stats():
+    with STATE_CHANGED:
+        spools = list(STATE["spools"])
+        return {
+            "bytes": STATE["bytes"],
+            "limit": MAX_INFLIGHT_BYTES,
+            "peak": STATE["peak"],
+            "rejected": STATE["rejected"],
+            "open": len(spools),
+            "memory_bytes": sum(spool.size for spool in spools if not spool.spilled),
+            "disk_bytes": sum(spool.size for spool in spools if spool.spilled),
+        }
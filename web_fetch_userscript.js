@@ -28,8 +28,33 @@
     const CFG_BTN = `cfg_${HOST}_btn`;
     const CFG_TEXT_OUTPUT = `cfg_${HOST}_text_output`;
     const CFG_UPLOAD = `cfg_${HOST}_upload_target`;
+    const CFG_WAITS = `cfg_${HOST}_waits`; // Tuned readiness wait maxima, see readyWait()
+    // Settings panel element types -> roles of the bridge's shared site profile
+    const PROFILE_ROLES = { prompt: 'prompt', button: 'submit', text: 'text', upload: 'upload' };
+
+    // Worker identity (Per Tab). sessionStorage survives reloads of this tab only,
+    // so a reloaded tab gets its leased job back from the server.
+    const WORKER_KEY = 'comfyui_bridge_worker_id';
+    const WORKER_ID = sessionStorage.getItem(WORKER_KEY) || `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+    sessionStorage.setItem(WORKER_KEY, WORKER_ID);
+    // Job and phase this tab is working on, so a reload resumes instead of generating twice.
+    // Per tab like WORKER_ID: GM storage is shared by every tab running the script.
+    const RESUME_KEY = `comfyui_bridge_job_${WORKER_ID}`;
+    const LEASE_RENEW_MS = 5000; // Also how quickly a job cancelled in ComfyUI is noticed
+    const POLL_WAIT_SECS = 25; // Long-poll: the server holds /job open until a job arrives
+    const STREAM_INTERVAL_MS = 300; // Text mode: minimum time between streamed chunks
+    const RESULT_BUSY_RETRIES = 5; // A result the bridge has no room for yet (503) is sent again this often
+    const RESULT_BUSY_DELAY_MS = 3000; // ...after this delay, growing with every attempt
+    const RESULT_OFFLINE_DELAY_MS = 5000; // A result the bridge could not be reached for is sent again after this
+    // Upper bounds for the readiness waits of a job (ms). The waits end as soon as the page
+    // is ready; these only apply when a site gives no detectable signal.
+    const WAIT_DEFAULTS = { upload: 2000, prompt: 2000, ready: 1000, started: 3000 };
+    const WAIT_MIN_MS = 1000; // Tuned maxima never drop below this
 
     let isProcessing = false;
+    let siteProfile = null; // Shared selectors for this site from the bridge, refreshed with every job
+    const resolvedCache = {}; // role -> element the heuristics found last time
+    const inputBlobCache = new Map(); // blob key -> Blob, oldest first
     let ui = null;
     let uiPanel = null;
     let selectionMode = null;
@@ -54,7 +79,25 @@
 
     function startBridge() {
         createUI();
-        setInterval(checkJob, 2000);
+        registerWorker().catch(() => { }).finally(pollLoop);
+    }
+
+    async function pollLoop() {
+        while (true) {
+            const connected = await checkJob();
+            if (!connected) await sleep(2000); // Back off while the server is unreachable
+        }
+    }
+
+    function registerWorker() {
+        return gmRequest(`${SERVER_URL}/workers`, 'POST', {
+            id: WORKER_ID,
+            origin: window.location.origin,
+            modes: ['image', 'text']
+        }).then(res => {
+            if (res && res.profile !== undefined) siteProfile = res.profile;
+            return res;
+        });
     }
 
     // --- UI HELPER ---
@@ -112,6 +155,7 @@
             clearBtn.style.cssText = "background:#333; border:1px solid #555; color:white; border-radius:3px; cursor:pointer;";
             clearBtn.onclick = () => {
                 GM_deleteValue(key);
+                publishSelector(type, null);
                 updatePanel();
             };
 
@@ -134,6 +178,14 @@
         uiPanel.appendChild(createRow("Text Output Area", CFG_TEXT_OUTPUT, 'text'));
         uiPanel.appendChild(createRow("Image Upload Target", CFG_UPLOAD, 'upload'));
 
+        // Timing
+        const resetWaits = document.createElement('button');
+        resetWaits.innerText = "⏱ Reset Tuned Waits";
+        resetWaits.title = "Forget the wait times learned on this site";
+        resetWaits.style.cssText = "background:#333; border:1px solid #555; color:white; border-radius:3px; cursor:pointer;";
+        resetWaits.onclick = () => GM_deleteValue(CFG_WAITS);
+        uiPanel.appendChild(resetWaits);
+
         // Close / Help
         const footer = document.createElement('div');
         footer.style.cssText = "margin-top:5px; border-top:1px solid #444; padding-top:5px; font-size:10px; color:#888; text-align:center;";
@@ -251,6 +303,7 @@
         else if (selectionMode === 'upload') key = CFG_UPLOAD;
 
         GM_setValue(key, selector);
+        publishSelector(selectionMode, selector);
         console.log(`[ComfyBridge] Saved selector for ${selectionMode}:`, selector);
 
         // Visual confirmation
@@ -291,13 +344,21 @@
 
 
     // --- NETWORK HELPER ---
-    function gmRequest(url, method = "GET", data = null) {
+    function gmRequest(url, method = "GET", data = null, extraHeaders = {}) {
+        // Blobs are sent as raw binary bodies, FormData as multipart (the browser sets
+        // the boundary header), everything else as JSON
+        const isBlob = data instanceof Blob;
+        const isForm = data instanceof FormData;
+        let headers = { "Content-Type": "application/json" };
+        if (isBlob) headers = { "Content-Type": data.type };
+        if (isForm) headers = {};
+        Object.assign(headers, extraHeaders);
         return new Promise((resolve, reject) => {
             GM_xmlhttpRequest({
                 method: method,
                 url: url,
-                data: data ? JSON.stringify(data) : null,
-                headers: { "Content-Type": "application/json" },
+                data: (isBlob || isForm) ? data : (data ? JSON.stringify(data) : null),
+                headers: headers,
                 onload: (response) => {
                     if (response.status >= 200 && response.status < 300) {
                         try {
@@ -307,7 +368,9 @@
                             resolve(response.responseText);
                         }
                     } else {
-                        reject(new Error(`HTTP ${response.status}`));
+                        const err = new Error(`HTTP ${response.status}`);
+                        err.status = response.status;
+                        reject(err);
                     }
                 },
                 onerror: (err) => { reject(new Error("Network Error")); },
@@ -318,99 +381,141 @@
 
     // --- MAIN LOOP ---
     async function checkJob() {
-        if (isProcessing) return;
+        if (isProcessing) return true;
 
         try {
-            const data = await gmRequest(`${SERVER_URL}/job`);
+            const data = await gmRequest(`${SERVER_URL}/job?worker=${WORKER_ID}&wait=${POLL_WAIT_SECS}`);
+
+            if (data.registered === false) {
+                // Server restarted or dropped us from the pool
+                await registerWorker();
+                return true;
+            }
 
             if (data.job) {
+                if (data.profile !== undefined) siteProfile = data.profile;
                 isProcessing = true;
                 await executeJob(data.job);
             } else {
                 if (selectionMode === null) updateStatus("Connected (Idle)", "#AAAAAA");
-                if (GM_getValue('comfy_job_id')) {
-                    GM_deleteValue('comfy_job_id');
-                    GM_deleteValue('comfy_job_phase');
-                }
             }
+            return true;
         } catch (e) {
             updateStatus("Disconnected", "#FF4444");
+            return false;
         }
     }
 
     async function executeJob(job) {
-        const storedId = GM_getValue('comfy_job_id') || (window.name.startsWith('comfy_job:') ? window.name.split(':')[1] : null);
-        let phase = GM_getValue('comfy_job_phase') || 'start';
+        const stored = loadResume();
+        let phase = 'start';
 
-        if (storedId === job.id) {
+        if (stored.id === job.id && stored.phase) {
+            phase = stored.phase;
             console.log(`[ComfyBridge] Resuming Job ${job.id} at phase ${phase}`);
             updateStatus(`Resuming (${phase})...`, "#00FF00");
         } else {
             console.log(`[ComfyBridge] Starting New Job ${job.id} (${job.mode})`);
-            GM_setValue('comfy_job_id', job.id);
-            GM_setValue('comfy_job_phase', 'start');
-            try { window.name = `comfy_job:${job.id}`; } catch (e) { }
-            phase = 'start';
+            saveResume(job.id, phase);
         }
 
+        let baselineImages = null;
+        let baselineText = null;
+        // job.timeout is what the bridge has left for this attempt; the result waits get the rest of it
+        const deadlineAt = Date.now() + (job.timeout || 60) * 1000;
+        const secondsLeft = () => Math.max((deadlineAt - Date.now()) / 1000, 1);
+
+        // Per-phase durations (ms), reported to the bridge with the result for its /metrics
+        const timings = new PhaseTimer();
+
+        // Cancellation: long waits are raced against this promise, which rejects once
+        // ComfyUI withdrew the job (interrupt, timeout)
+        let cancelJob = null;
+        const cancelled = new Promise((_, reject) => { cancelJob = reject; });
+        cancelled.catch(() => { });
+        const untilCancelled = (promise) => Promise.race([promise, cancelled]);
+
+        // Keep our lease on the job alive while we work on it
+        const leaseTimer = setInterval(() => {
+            gmRequest(`${SERVER_URL}/lease/${job.id}?worker=${WORKER_ID}`, 'POST').catch(err => {
+                if (err.status === 410) {
+                    const abort = new Error("Cancelled by ComfyUI");
+                    abort.cancelled = true;
+                    cancelJob(abort);
+                    return;
+                }
+                console.warn(`[ComfyBridge] Lease renewal for job ${job.id} failed:`, err.message);
+            });
+        }, LEASE_RENEW_MS);
+
         try {
             // PHASE 1: INPUT (Image + Prompt)
             if (phase === 'start') {
                 updateStatus("Preparing Input...", "#00FFFF");
 
                 // 1.1 Upload Image if present
-                if (job.input_image) {
+                if (job.input_blob) {
                     updateStatus("Uploading Image...", "#00FFFF");
                     const uploadTarget = findUploadTarget();
                     if (uploadTarget) {
-                        await uploadImage(uploadTarget, job.input_image);
-                        await sleep(2000); // Wait for upload to process
+                        const blob = await fetchInputBlob(job.input_blob).catch(e => {
+                            throw jobError(`Could not load input image: ${e.message}`, 'upload_failed');
+                        });
+                        const imagesBefore = getImgSrcs();
+                        await uploadImage(uploadTarget, blob);
+                        // Ready once the site shows a preview of the upload
+                        await readyWait('upload', () => [...document.images].some(i => i.src && !imagesBefore.has(i.src)));
                     } else {
                         console.warn("[ComfyBridge] No upload target found. Skipping image upload.");
                     }
+                    timings.lap('input');
                 }
 
                 // 1.2 Type Prompt
                 updateStatus("Type Prompt...", "#00FFFF");
                 let promptBox = findPromptBox(job.selectors);
                 if (!promptBox) {
-                    await sleep(2000);
-                    promptBox = findPromptBox(job.selectors);
+                    promptBox = await readyWait('prompt', () => findPromptBox(job.selectors));
                 }
 
-                if (!promptBox) {
-                    console.warn("[ComfyBridge] Prompt box not found. Checking if we should wait for result...");
-                    phase = 'wait_result';
-                    GM_setValue('comfy_job_phase', phase);
-                } else {
-                    promptBox.focus();
-                    promptBox.value = job.prompt;
-                    promptBox.dispatchEvent(new Event('input', { bubbles: true }));
-                    if (promptBox.getAttribute('contenteditable') === 'true') {
-                        promptBox.innerText = job.prompt;
-                        promptBox.dispatchEvent(new Event('change', { bubbles: true }));
-                    }
+                // Reported right away, so the bridge can still retry the job
+                if (!promptBox) throw jobError("Prompt box not found", 'prompt_not_found');
 
-                    phase = 'generate';
-                    GM_setValue('comfy_job_phase', phase);
-                    await sleep(500);
+                promptBox.focus();
+                promptBox.value = job.prompt;
+                promptBox.dispatchEvent(new Event('input', { bubbles: true }));
+                if (promptBox.getAttribute('contenteditable') === 'true') {
+                    promptBox.innerText = job.prompt;
+                    promptBox.dispatchEvent(new Event('change', { bubbles: true }));
                 }
+
+                phase = 'generate';
+                saveResume(job.id, phase);
+                timings.lap('type');
             }
 
             // PHASE 2: CLICK Generate
             if (phase === 'generate') {
                 updateStatus("Click Generate...", "#00FFFF");
 
-                let btn = findGenerateButton(job.selectors);
-                if (!btn) {
-                    console.warn("[ComfyBridge] Generate button not found.");
-                } else {
-                    btn.click();
-                }
+                // Sites enable the button once they accepted the typed prompt
+                let btn = await readyWait('ready', () => {
+                    const b = findGenerateButton(job.selectors);
+                    return b && !isDisabled(b) ? b : null;
+                }) || findGenerateButton(job.selectors);
+                if (!btn) throw jobError("Generate button not found", 'button_not_found');
 
                 phase = 'wait_result';
-                GM_setValue('comfy_job_phase', phase);
-                await sleep(3000);
+                saveResume(job.id, phase);
+
+                const promptBox = findPromptBox(job.selectors);
+                const typed = promptBox && readValue(promptBox);
+                baselineImages = getImgSrcs(); // Before clicking, so fast results count as new
+                if (job.mode === 'text') baselineText = textContainer().innerText;
+                btn.click();
+                // Request in flight: the button goes away or is disabled, or the prompt box is cleared
+                await readyWait('started', () => !btn.isConnected || isDisabled(btn) || (typed && !readValue(promptBox)));
+                timings.lap('click');
             }
 
             // PHASE 3: WAIT Result
@@ -419,54 +524,81 @@
 
                 if (mode === 'text') {
                     updateStatus("Waiting for Text...", "#FFFF00");
-                    const text = await waitForText(job.timeout || 60);
+                    const stream = { sent: '', closed: false };
+                    const text = await untilCancelled(waitForText(secondsLeft(), (job.settle || 2) * 1000, current => streamText(job.id, stream, current), baselineText, job.prompt));
+                    timings.lap('result');
 
-                    updateStatus("Uploading Text...", "#00FF00");
-                    await gmRequest(`${SERVER_URL}/result`, 'POST', { text: text });
+                    if (stream.closed) {
+                        console.log(`[ComfyBridge] ComfyUI already finished job ${job.id} from the streamed text.`);
+                    } else {
+                        updateStatus("Uploading Text...", "#00FF00");
+                        await postResult(job.id, { text: text }, timings.header());
+                    }
 
                 } else {
                     // IMAGE MODE
                     updateStatus("Waiting for Image...", "#FFFF00");
-                    const currentImages = getImgSrcs();
+                    const currentImages = baselineImages || getImgSrcs();
 
-                    let resultSrc = null;
+                    let resultSrcs = [];
                     try {
-                        resultSrc = await waitForNewImage(currentImages, job.timeout || 60);
+                        resultSrcs = await untilCancelled(waitForNewImages(currentImages, secondsLeft(), job.collect === 'all', (job.settle || 2) * 1000));
                     } catch (e) {
+                        if (e.cancelled) throw e;
                         console.warn("[ComfyBridge] Timeout. Checking robust fallback...");
                         const allImgs = [...document.images].filter(i => i.naturalWidth > 200);
-                        if (allImgs.length > 0) resultSrc = allImgs[allImgs.length - 1].src;
+                        if (allImgs.length > 0) resultSrcs = [allImgs[allImgs.length - 1].src];
                         else throw e;
                     }
+                    timings.lap('result');
 
-                    updateStatus("Uploading Image...", "#00FF00");
-                    await sendImageResult(resultSrc);
+                    updateStatus(resultSrcs.length > 1 ? `Uploading ${resultSrcs.length} Images...` : "Uploading Image...", "#00FF00");
+                    await sendImageResult(job.id, resultSrcs, job.fetch === 'server', timings);
                 }
 
-                GM_deleteValue('comfy_job_id');
-                GM_deleteValue('comfy_job_phase');
+                clearResume();
                 updateStatus("Done!", "#00FF00");
             }
 
         } catch (e) {
-            console.error(e);
-            updateStatus("Error: " + e.message, "#FF0000");
-            await sleep(1000);
-            gmRequest(`${SERVER_URL}/result`, 'POST', { error: e.message }).catch(err => { });
-            GM_deleteValue('comfy_job_id');
-            GM_deleteValue('comfy_job_phase');
+            if (e.cancelled) {
+                console.log(`[ComfyBridge] Job ${job.id} was cancelled in ComfyUI.`);
+                updateStatus("Cancelled", "#FFA500");
+            } else {
+                console.error(e);
+                updateStatus("Error: " + e.message, "#FF0000");
+                // The kind lets the bridge decide whether another attempt is worth it
+                gmRequest(`${SERVER_URL}/result/${job.id}`, 'POST', { error: e.message, kind: e.kind || null }).catch(err => { });
+            }
+            clearResume();
         } finally {
+            clearInterval(leaseTimer);
             isProcessing = false;
         }
     }
 
+    function loadResume() {
+        try { return JSON.parse(sessionStorage.getItem(RESUME_KEY)) || {}; } catch (e) { return {}; }
+    }
+    function saveResume(jobId, phase) { sessionStorage.setItem(RESUME_KEY, JSON.stringify({ id: jobId, phase: phase })); }
+    function clearResume() { sessionStorage.removeItem(RESUME_KEY); }
+
     // --- UPLOAD HELPER ---
-    async function uploadImage(target, base64Data) {
+    async function fetchInputBlob(key) {
+        // Input images are content-addressed: the same key always means the same bytes,
+        // so each tab downloads a given image only once.
+        if (!inputBlobCache.has(key)) {
+            const blob = await toBlob(`${SERVER_URL}/blob/${key}`);
+            inputBlobCache.set(key, blob);
+            if (inputBlobCache.size > 8) inputBlobCache.delete(inputBlobCache.keys().next().value);
+        }
+        return inputBlobCache.get(key);
+    }
+
+    async function uploadImage(target, blob) {
         try {
-            // Convert base64 to Blob
-            const res = await fetch(base64Data);
-            const blob = await res.blob();
-            const file = new File([blob], "image.png", { type: "image/png" });
+            const type = blob.type || "image/png";
+            const file = new File([blob], `image.${type.split('/')[1]}`, { type: type });
 
             // Create DataTransfer
             const dt = new DataTransfer();
@@ -496,6 +628,7 @@
 
         } catch (e) {
             console.error("[ComfyBridge] Upload failed:", e);
+            throw jobError(`Image upload failed: ${e.message}`, 'upload_failed');
         }
     }
 
@@ -511,7 +644,11 @@
             } catch (e) { console.warn("Invalid custom selection for upload", custom); }
         }
 
-        // 2. Heuristic: Fallback to Prompt Box (Paste usually works there)
+        // 2. Site Profile
+        const shared = queryProfile('upload');
+        if (shared) return shared;
+
+        // 3. Heuristic: Fallback to Prompt Box (Paste usually works there)
         return findPromptBox(null);
     }
 
@@ -528,7 +665,15 @@
         // 2. Server Hint
         if (serverSelectors && serverSelectors.prompt) return document.querySelector(serverSelectors.prompt);
 
-        // 3. Heuristics
+        // 3. Site Profile
+        const shared = queryProfile('prompt');
+        if (shared) return shared;
+
+        // 4. Heuristics (cached)
+        return cachedResolve('prompt', scanPromptBox);
+    }
+
+    function scanPromptBox() {
         const candidates = [
             ...document.querySelectorAll('textarea'),
             ...document.querySelectorAll('div[contenteditable="true"]'),
@@ -573,99 +718,356 @@
         // 2. Server Hint
         if (serverSelectors && serverSelectors.submit) return document.querySelector(serverSelectors.submit);
 
-        // 3. Heuristics
+        // 3. Site Profile
+        const shared = queryProfile('submit');
+        if (shared) return shared;
+
+        // 4. Heuristics (cached)
+        return cachedResolve('submit', () => {
+            const buttons = [...document.querySelectorAll('button'), ...document.querySelectorAll('input[type="submit"]'), ...document.querySelectorAll('div[role="button"]')];
+            return buttons.find(isGenerateButton) || null;
+        }, isGenerateButton);
+    }
+
+    function isGenerateButton(btn) {
+        if (btn.offsetParent === null) return false;
         const keywords = ['generate', 'create', 'run', 'submit', 'send', 'dream'];
-        const buttons = [...document.querySelectorAll('button'), ...document.querySelectorAll('input[type="submit"]'), ...document.querySelectorAll('div[role="button"]')];
+        const aria = (btn.getAttribute('aria-label') || "").toLowerCase();
+        const txt = (btn.innerText + btn.value).toLowerCase();
+        return keywords.some(k => txt.includes(k) || aria.includes(k)) || aria.includes('send') || aria.includes('submit');
+    }
+
+    // --- SITE PROFILE / CACHE ---
+    function queryProfile(role) {
+        const selector = siteProfile && siteProfile.selectors ? siteProfile.selectors[role] : null;
+        if (!selector) return null;
+        try {
+            return document.querySelector(selector);
+        } catch (e) {
+            console.warn("Invalid profile selector", role, selector);
+            return null;
+        }
+    }
 
-        for (let btn of buttons) {
-            if (btn.offsetParent === null) continue;
-            const aria = (btn.getAttribute('aria-label') || "").toLowerCase();
-            const txt = (btn.innerText + btn.value).toLowerCase();
+    function cachedResolve(role, scan, isValid = el => el.offsetParent !== null) {
+        // The heuristic scans walk the whole DOM. The last element found per role is reused
+        // while it is still attached and passes isValid, so a scan only runs on a cache miss.
+        const cached = resolvedCache[role];
+        if (cached && cached.isConnected && isValid(cached)) return cached;
+        const el = scan();
+        resolvedCache[role] = el;
+        return el;
+    }
 
-            if (keywords.some(k => txt.includes(k) || aria.includes(k))) return btn;
-            if (aria.includes('send') || aria.includes('submit')) return btn;
+    async function publishSelector(type, selector) {
+        // Shares a picked (or reset) selector through the bridge's site profile, so other
+        // tabs and machines on this site use it too
+        const role = PROFILE_ROLES[type];
+        try {
+            const current = await gmRequest(`${SERVER_URL}/profiles/${HOST}`).then(res => res.profile).catch(() => null);
+            const res = await gmRequest(`${SERVER_URL}/profiles/${HOST}`, 'POST', { selectors: { [role]: selector }, version: current ? current.version : 0 });
+            siteProfile = res.profile;
+        } catch (e) {
+            console.warn("[ComfyBridge] Could not update the site profile:", e.message);
         }
-        return null;
+    }
+
+    function isDisabled(el) {
+        return el.disabled || el.getAttribute('aria-disabled') === 'true';
+    }
+
+    function readValue(el) {
+        return ((el.value !== undefined ? el.value : el.innerText) || '').trim();
+    }
+
+    // --- READINESS WAITS ---
+    function waitUntil(check, maxMs) {
+        // Resolves with the first truthy result of check(), re-checked on every DOM change
+        // and on a short interval (for state the DOM does not show), or null after maxMs
+        return new Promise(resolve => {
+            const finish = (value) => {
+                observer.disconnect();
+                clearInterval(poll);
+                clearTimeout(timer);
+                resolve(value);
+            };
+            const test = () => {
+                const value = check();
+                if (value) finish(value);
+            };
+            const observer = new MutationObserver(records => { if (!isOwnMutation(records)) test(); });
+            const poll = setInterval(test, 250);
+            const timer = setTimeout(() => finish(null), maxMs);
+            observer.observe(document.body, { childList: true, subtree: true, attributes: true, characterData: true });
+            test();
+        });
+    }
+
+    async function readyWait(name, check) {
+        // waitUntil with a per-site maximum: twice the slowest recent wait on this site,
+        // between WAIT_MIN_MS and the default. A timeout resets it to the default.
+        const waits = GM_getValue(CFG_WAITS) || {};
+        const seen = waits[name];
+        const maxMs = seen === undefined ? WAIT_DEFAULTS[name] : Math.min(WAIT_DEFAULTS[name], Math.max(WAIT_MIN_MS, seen * 2));
+        const started = performance.now();
+        const value = await waitUntil(check, maxMs);
+
+        if (value) waits[name] = Math.round(Math.max(performance.now() - started, (seen || 0) * 0.8)); // Slowly decaying peak
+        else delete waits[name];
+        GM_setValue(CFG_WAITS, waits);
+        return value;
     }
 
     function getImgSrcs() {
         return new Set([...document.images].map(i => i.src));
     }
 
-    async function waitForNewImage(oldImages, timeoutSecs) {
-        const start = Date.now();
-        while ((Date.now() - start) < timeoutSecs * 1000) {
-            const currentImages = [...document.images];
-            for (let img of currentImages) {
-                if (img.src && !oldImages.has(img.src) && img.naturalWidth > 200 && img.naturalHeight > 200) {
-                    return img.src;
+    function isOwnMutation(records) {
+        // Status updates of our own overlay must not count as page activity
+        return ui !== null && records.every(r => ui.contains(r.target));
+    }
+
+    function waitForNewImages(oldImages, timeoutSecs, collectAll = false, settleMs = 2000) {
+        // Event-driven: rescans only when the DOM changes or an image finishes loading.
+        // Returns new result images in page order. With collectAll, keeps watching until
+        // no further image appeared for settleMs (sites that render 2-4 images per prompt).
+        return new Promise((resolve, reject) => {
+            let found = [];
+            let settleTimer = null;
+
+            const finish = (result, error) => {
+                observer.disconnect();
+                document.removeEventListener('load', onLoad, true);
+                clearTimeout(settleTimer);
+                clearTimeout(timeoutTimer);
+                if (error) reject(error);
+                else resolve(result);
+            };
+
+            const scan = () => {
+                const current = [];
+                for (let img of document.images) {
+                    if (img.src && !oldImages.has(img.src) && img.naturalWidth > 200 && img.naturalHeight > 200 && !current.includes(img.src)) {
+                        current.push(img.src);
+                    }
                 }
-            }
-            await sleep(1000);
-        }
-        throw new Error("Timeout waiting for image");
+                if (current.join('\n') === found.join('\n')) return;
+                found = current;
+                if (found.length === 0) return;
+                if (!collectAll) {
+                    finish(found.slice(0, 1));
+                    return;
+                }
+                clearTimeout(settleTimer);
+                settleTimer = setTimeout(() => finish(found), settleMs);
+            };
+
+            const observer = new MutationObserver(records => { if (!isOwnMutation(records)) scan(); });
+            // load does not bubble, but it can be caught in the capture phase
+            const onLoad = (e) => { if (e.target.tagName === 'IMG') scan(); };
+            const timeoutTimer = setTimeout(() => {
+                if (found.length > 0) finish(found);
+                else finish(null, jobError("Timeout waiting for image", 'timeout'));
+            }, timeoutSecs * 1000);
+
+            observer.observe(document.body, { childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'srcset'] });
+            document.addEventListener('load', onLoad, true);
+            scan(); // The result may already be on the page
+        });
     }
 
-    async function waitForText(timeoutSecs) {
+    function textContainer() {
         const custom = GM_getValue(CFG_TEXT_OUTPUT);
-        let container = custom ? document.querySelector(custom) : document.body;
+        return (custom ? document.querySelector(custom) : queryProfile('text')) || document.body;
+    }
 
-        if (!container) container = document.body;
+    function freshText(text, baseline, prompt) {
+        // The part of text that was not there before Generate was clicked: whatever is left
+        // between the prefix and suffix it shares with the baseline (menus, earlier answers,
+        // the typed prompt), minus the prompt if the site echoes it first.
+        if (baseline === null) return text;
+        let start = 0;
+        while (start < text.length && start < baseline.length && text[start] === baseline[start]) start++;
+        let end = 0;
+        while (end < text.length - start && end < baseline.length - start &&
+               text[text.length - 1 - end] === baseline[baseline.length - 1 - end]) end++;
+        let fresh = text.slice(start, text.length - end).trim();
+        if (prompt && fresh.startsWith(prompt.trim())) fresh = fresh.slice(prompt.trim().length).trim();
+        return fresh;
+    }
 
-        console.log("[ComfyBridge] Waiting for text in:", container);
+    function waitForText(timeoutSecs, settleMs = 2000, onProgress = null, baseline = null, prompt = '') {
+        // baseline: container text from before Generate was clicked. Only text that appeared
+        // since then is streamed and returned, so stop_sequence and max_chars see the answer alone.
+        const container = textContainer();
+        const current = () => freshText(container.innerText, baseline, prompt);
 
-        let lastText = container.innerText;
-        let stableCount = 0;
-        const start = Date.now();
+        console.log("[ComfyBridge] Waiting for text in:", container);
 
-        let hasStarted = false;
+        // Event-driven: innerText is only read once the container stopped mutating
+        // for settleMs ("streaming finished"), not on every tick. While it changes, the
+        // text is handed to onProgress at most every STREAM_INTERVAL_MS; onProgress
+        // resolves to true when the receiver needs no more text.
+        return new Promise((resolve, reject) => {
+            let hasStarted = false;
+            let settleTimer = null;
+            let lastReport = 0;
+            let reportInFlight = false;
+
+            const report = () => {
+                if (!onProgress || reportInFlight || (Date.now() - lastReport) < STREAM_INTERVAL_MS) return;
+                reportInFlight = true;
+                lastReport = Date.now();
+                onProgress(current())
+                    .then(stop => { if (stop) finish(current()); })
+                    .catch(e => console.warn("[ComfyBridge] Streaming text failed:", e.message))
+                    .finally(() => { reportInFlight = false; });
+            };
 
-        while ((Date.now() - start) < timeoutSecs * 1000) {
-            const currentText = container.innerText;
+            const finish = (result, error) => {
+                observer.disconnect();
+                clearTimeout(settleTimer);
+                clearTimeout(quietTimer);
+                clearTimeout(timeoutTimer);
+                if (error) reject(error);
+                else resolve(result);
+            };
 
-            if (currentText.length !== lastText.length) {
+            const observer = new MutationObserver(records => {
+                if (isOwnMutation(records)) return;
                 hasStarted = true;
-                lastText = currentText;
-                stableCount = 0;
-            } else {
-                if (hasStarted) {
-                    stableCount++;
-                    if (stableCount >= 4) {
-                        return lastText;
-                    }
-                } else {
-                    if ((Date.now() - start) > 5000 && currentText.length > 50) {
-                        return currentText;
-                    }
+                report();
+                clearTimeout(settleTimer);
+                settleTimer = setTimeout(() => finish(current()), settleMs);
+            });
+
+            // Generation may have finished before we started watching
+            const quietTimer = setTimeout(() => {
+                if (hasStarted) return;
+                const text = current();
+                if (text.length > 50) finish(text);
+            }, 5000);
+
+            const timeoutTimer = setTimeout(() => {
+                if (hasStarted) finish(current());
+                else finish(null, jobError("Timeout waiting for text generation", 'timeout'));
+            }, timeoutSecs * 1000);
+
+            observer.observe(container, { childList: true, subtree: true, characterData: true });
+        });
+    }
+
+    async function streamText(jobId, stream, text) {
+        // Sends only what changed since the last chunk: everything after the common prefix
+        let offset = 0;
+        const max = Math.min(stream.sent.length, text.length);
+        while (offset < max && stream.sent[offset] === text[offset]) offset++;
+        if (offset === text.length && offset === stream.sent.length) return false;
+
+        const res = await gmRequest(`${SERVER_URL}/result/${jobId}/partial`, 'POST', { offset: offset, delta: text.slice(offset) });
+        stream.sent = text;
+        stream.closed = res.status === 'closed';
+        return stream.closed;
+    }
+
+    // --- UTILS ---
+    async function sendImageResult(jobId, srcs, direct = false, timings = new PhaseTimer()) {
+        // Direct download: hand the http(s) URLs to the bridge and let it fetch them itself.
+        // blob:/data: URLs only exist inside this page, so those are always relayed.
+        if (direct && srcs.every(src => /^https?:/.test(src))) {
+            try {
+                await postResult(jobId, { urls: srcs.map(src => ({ url: src, headers: downloadHeaders(src) })) }, timings.header());
+                return;
+            } catch (e) {
+                console.warn("[ComfyBridge] Direct download failed, relaying image bytes instead.", e);
+            }
+        }
+
+        // Binary upload: no base64 inflation, the server decodes the bytes directly.
+        // Several images go out together as one multipart/form-data result.
+        const blobs = [];
+        for (const src of srcs) {
+            let blob = await toBlob(src);
+            if (!blob.type.startsWith('image/')) blob = new Blob([blob], { type: 'image/png' });
+            blobs.push(blob);
+        }
+        timings.lap('collect');
+        if (blobs.length === 1) {
+            await postResult(jobId, blobs[0], timings.header());
+            return;
+        }
+        const form = new FormData();
+        blobs.forEach((blob, i) => form.append('image', blob, `image_${i}`));
+        await postResult(jobId, form, timings.header());
+    }
+
+    async function postResult(jobId, body, headers) {
+        // A finished generation is never dropped for a transient bridge problem:
+        // - no answer (ComfyUI restarting): hold the result and send it again until the
+        //   bridge is back; it knows the job again from its journal
+        // - 503: the bridge holds too many results ComfyUI has not picked up yet
+        let busy = 0;
+        while (true) {
+            try {
+                return await gmRequest(`${SERVER_URL}/result/${jobId}`, 'POST', body, headers);
+            } catch (e) {
+                if (e.status === undefined) {
+                    updateStatus("Bridge unreachable, holding result...", "#FFA500");
+                    await sleep(RESULT_OFFLINE_DELAY_MS);
+                    continue;
                 }
+                if (e.status !== 503 || busy >= RESULT_BUSY_RETRIES) throw e;
+                busy++;
+                updateStatus(`Bridge busy, retrying upload (${busy}/${RESULT_BUSY_RETRIES})...`, "#FFA500");
+                await sleep(RESULT_BUSY_DELAY_MS * busy);
             }
-            await sleep(500);
         }
+    }
 
-        if (hasStarted) return lastText;
-        throw new Error("Timeout waiting for text generation");
+    function downloadHeaders(src) {
+        // Headers the page would send for the image. Cookies only go to this site's own hosts.
+        const headers = { "Referer": location.href, "User-Agent": navigator.userAgent };
+        const host = new URL(src).hostname;
+        if (document.cookie && (host === location.hostname || host.endsWith('.' + location.hostname))) {
+            headers["Cookie"] = document.cookie;
+        }
+        return headers;
     }
 
-    // --- UTILS ---
-    async function sendImageResult(src) {
-        const dataUrl = await toDataURL(src);
-        await gmRequest(`${SERVER_URL}/result`, 'POST', { image: dataUrl });
+    class PhaseTimer {
+        // Each lap() records the time since the previous one under the given phase name
+        constructor() { this.phases = {}; this.last = performance.now(); }
+        lap(name) {
+            const now = performance.now();
+            this.phases[name] = Math.round(now - this.last);
+            this.last = now;
+        }
+        header() { return { "X-WebBridge-Timings": JSON.stringify(this.phases) }; }
+    }
+
+    function jobError(message, kind) {
+        // kind: timeout, prompt_not_found, button_not_found, upload_failed (see the bridge's scheduler)
+        const err = new Error(message);
+        err.kind = kind;
+        return err;
     }
 
     function sleep(ms) { return new Promise(r => setTimeout(r, ms)); }
 
-    async function toDataURL(url) {
-        if (url.startsWith('data:')) return url;
+    async function toBlob(url) {
+        // data: and blob: URLs are readable from the page itself
+        if (url.startsWith('data:') || url.startsWith('blob:')) {
+            const res = await fetch(url);
+            return res.blob();
+        }
         return new Promise((resolve, reject) => {
             GM_xmlhttpRequest({
                 method: "GET",
                 url: url,
                 responseType: "blob",
                 onload: (response) => {
-                    const reader = new FileReader();
-                    reader.onloadend = () => resolve(reader.result);
-                    reader.onerror = reject;
-                    reader.readAsDataURL(response.response);
+                    if (response.status >= 400) reject(new Error(`HTTP ${response.status} for ${url}`));
+                    else resolve(response.response);
                 },
                 onerror: reject
             });